@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Fan-out of cached query reads on a Redis Cluster, with the default
+cache key generators and the hash-tagged ones.
+
+Each read fetches the query result and the invalidations of its tables
+in a single ``get_many``.  A local stand-in of a cluster maps these keys
+to hash slots and nodes like Redis Cluster does, and counts the slots
+and nodes each read needs.  A read spanning several slots cannot be
+a single ``MGET``: the client must split it, or Redis refuses it
+with a ``CROSSSLOT`` error.
+
+Run: ``python benchmark_cluster.py``
+"""
+import os
+from binascii import crc_hqx
+from collections import Counter
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+import django
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.cache.backends.base import default_key_func
+from django.db import DEFAULT_DB_ALIAS
+
+from cachalot.tests.models import Test, TestChild
+from cachalot.utils import (
+    _get_tables, get_hash_tagged_query_cache_key,
+    get_hash_tagged_table_cache_key, get_query_cache_key, get_table_cache_key,
+)
+
+
+SLOTS = 16384
+NODES_COUNTS = (3, 6, 12)
+QUERIES_COUNT = 1000
+
+LAYOUTS = (
+    ('default', get_query_cache_key, get_table_cache_key),
+    ('hash tags', get_hash_tagged_query_cache_key,
+     get_hash_tagged_table_cache_key),
+)
+
+QUERYSETS = (
+    lambda i: Test.objects.filter(name=str(i)),
+    lambda i: Test.objects.filter(name=str(i)).select_related('owner'),
+    lambda i: Test.objects.filter(name=str(i))
+    .select_related('owner', 'permission__content_type'),
+    lambda i: TestChild.objects.filter(name=str(i))
+    .filter(permissions__content_type__model='test')
+    .filter(pk__in=User.objects.filter(groups__name=str(i)).values('pk')),
+)
+
+
+def get_slot(key):
+    """Hash slot of a Redis key, including its hash tag."""
+    start = key.find('{')
+    if start != -1:
+        end = key.find('}', start + 1)
+        if end > start + 1:
+            key = key[start + 1:end]
+    return crc_hqx(key.encode('utf-8'), 0) % SLOTS
+
+
+class ClusterStandIn:
+    """Nodes owning equal ranges of hash slots, like a fresh cluster."""
+
+    def __init__(self, nodes_count):
+        self.nodes_count = nodes_count
+        self.requests_per_node = Counter()
+
+    def get_node(self, slot):
+        return slot * self.nodes_count // SLOTS
+
+    def get_many(self, keys):
+        """
+        Returns the number of slots and of nodes a ``get_many`` of ``keys``
+        is sent to.
+        """
+        # Django prefixes keys with `KEY_PREFIX` and the version.
+        slots = {get_slot(default_key_func(key, '', 1)) for key in keys}
+        nodes = {self.get_node(slot) for slot in slots}
+        self.requests_per_node.update(self.get_node(slot) for slot in slots)
+        return len(slots), len(nodes)
+
+
+def get_read_keys(queryset, query_keygen, table_keygen):
+    compiler = queryset.query.get_compiler(DEFAULT_DB_ALIAS)
+    sql_and_params = compiler.as_sql()
+    compiler.as_sql = lambda: sql_and_params
+    cache_key = query_keygen(compiler)
+    tables = _get_tables(DEFAULT_DB_ALIAS, queryset.query, compiler)
+    return [table_keygen(DEFAULT_DB_ALIAS, t) for t in tables] + [cache_key]
+
+
+def run():
+    print('%-10s%-7s%-11s%12s%12s%14s%14s' % (
+        'query', 'nodes', 'layout', 'slots/read', 'nodes/read',
+        'single MGET', 'busiest node'))
+    for get_queryset in QUERYSETS:
+        reads_per_layout = {
+            layout: [get_read_keys(get_queryset(i), query_keygen,
+                                   table_keygen)
+                     for i in range(QUERIES_COUNT)]
+            for layout, query_keygen, table_keygen in LAYOUTS}
+        name = '%d tables' % (len(reads_per_layout['default'][0]) - 1)
+        for nodes_count in NODES_COUNTS:
+            for layout, _, _ in LAYOUTS:
+                cluster = ClusterStandIn(nodes_count)
+                slots_total = nodes_total = single = 0
+                for keys in reads_per_layout[layout]:
+                    slots, nodes = cluster.get_many(keys)
+                    slots_total += slots
+                    nodes_total += nodes
+                    single += slots == 1
+                busiest = (max(cluster.requests_per_node.values())
+                           / sum(cluster.requests_per_node.values()))
+                print('%-10s%-7d%-11s%12.2f%12.2f%13.0f%%%13.0f%%' % (
+                    name, nodes_count, layout,
+                    slots_total / QUERIES_COUNT, nodes_total / QUERIES_COUNT,
+                    100 * single / QUERIES_COUNT, 100 * busiest))
+
+
+if __name__ == '__main__':
+    run()
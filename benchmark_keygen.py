@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of query cache key generation against the number
+of query parameters.  SQL compilation is done beforehand, so that only
+the cost of the key generation itself is measured.
+
+Run: ``python benchmark_keygen.py``
+"""
+import os
+from hashlib import sha1
+from timeit import Timer
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+import django
+django.setup()
+
+from django.db import DEFAULT_DB_ALIAS
+
+from cachalot.tests.models import Test
+from cachalot.utils import (
+    CACHABLE_PARAM_TYPES, check_parameter_types, get_blake2b_query_cache_key,
+    get_query_cache_key,
+)
+
+
+PARAMS_COUNTS = (1, 10, 100, 1000, 10000)
+
+
+def get_legacy_query_cache_key(compiler):
+    """Query cache key generation before django-cachalot 2.9."""
+    sql, params = compiler.as_sql()
+    for p in params:
+        if p.__class__ not in CACHABLE_PARAM_TYPES:
+            check_parameter_types((p,))
+    cache_key = '%s:%s:%s' % (compiler.using, sql,
+                              [str(p) for p in params])
+    compiler.__cachalot_generated_sql = sql.lower()
+    return sha1(cache_key.encode('utf-8')).hexdigest()
+
+
+KEYGENS = (
+    ('legacy', get_legacy_query_cache_key),
+    ('sha1', get_query_cache_key),
+    ('blake2b', get_blake2b_query_cache_key),
+)
+
+
+def get_compiler(params_count):
+    qs = Test.objects.filter(pk__in=range(params_count))
+    compiler = qs.query.get_compiler(DEFAULT_DB_ALIAS)
+    sql_and_params = compiler.as_sql()
+    compiler.as_sql = lambda: sql_and_params
+    return compiler
+
+
+def run():
+    print('%-10s' % 'params'
+          + ''.join('%14s' % name for name, _ in KEYGENS))
+    for params_count in PARAMS_COUNTS:
+        compiler = get_compiler(params_count)
+        row = '%-10d' % params_count
+        for _, keygen in KEYGENS:
+            timer = Timer(lambda: keygen(compiler))
+            number, _ = timer.autorange()
+            duration = min(timer.repeat(repeat=5, number=number)) / number
+            row += '%11.1f µs' % (duration * 1e6)
+        print(row)
+
+
+if __name__ == '__main__':
+    run()
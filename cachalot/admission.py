@@ -0,0 +1,62 @@
+from array import array
+from threading import Lock
+
+
+class FrequencySketch:
+    """
+    Approximate, process-local count of how many times each query cache key
+    missed, in a fixed amount of memory (count-min sketch).
+
+    All counters are halved after ``10 × width`` increments, so that queries
+    that were frequent a long time ago are progressively forgotten.
+    """
+
+    depth = 4
+
+    def __init__(self, width=2 ** 16):
+        self.width = width
+        self._lock = Lock()
+        self._counters = [array('B', bytes(width)) for _ in range(self.depth)]
+        self._increments = 0
+
+    def _get_indexes(self, key):
+        h = hash(key)
+        width = self.width
+        return [(h >> (i * 16)) % width for i in range(self.depth)]
+
+    def get(self, key):
+        return min(counters[index] for counters, index
+                   in zip(self._counters, self._get_indexes(key)))
+
+    def increment(self, key):
+        """Counts a new occurrence of ``key`` and returns its estimated count."""
+        count = 255
+        # Races between threads only make counts slightly less accurate.
+        for counters, index in zip(self._counters, self._get_indexes(key)):
+            value = counters[index]
+            if value < 255:
+                value += 1
+                counters[index] = value
+            if value < count:
+                count = value
+        self._increments += 1
+        if self._increments >= 10 * self.width:
+            self._age()
+        return count
+
+    def _age(self):
+        with self._lock:
+            if self._increments < 10 * self.width:
+                return
+            self._counters = [array('B', [value >> 1 for value in counters])
+                              for counters in self._counters]
+            self._increments = 0
+
+    def clear(self):
+        with self._lock:
+            self._counters = [array('B', bytes(self.width))
+                              for _ in range(self.depth)]
+            self._increments = 0
+
+
+miss_sketch = FrequencySketch()
@@ -1,15 +1,20 @@
+from collections import defaultdict
 from contextlib import contextmanager
 from typing import Any, Optional, Tuple, Union
 
 from django.apps import apps
 from django.conf import settings
 from django.db import connections
+from django.db.models import QuerySet
 
 from .cache import cachalot_caches
+from .memo import memo_caches
 from .settings import cachalot_settings
 from .signals import post_invalidation
 from .transaction import AtomicCache
-from .utils import _invalidate_tables
+from .utils import (
+    _get_table_cache_alias, _invalidate_tables, _invalidate_tables_per_db,
+    _uses_versions)
 
 
 try:
@@ -20,12 +25,12 @@ except ImportError:
     LOCAL_STORAGE = threading.local()
 
 
-__all__ = ('invalidate', 'get_last_invalidation', 'cachalot_disabled')
+__all__ = ('invalidate', 'get_last_invalidation', 'set_cache_timeout',
+           'batch_invalidations', 'memoize_cache_reads', 'cachalot_disabled')
 
 
-def _cache_db_tables_iterator(tables, cache_alias, db_alias):
+def _cache_db_tables_iterator(tables, cache_aliases, db_alias):
     no_tables = not tables
-    cache_aliases = settings.CACHES if cache_alias is None else (cache_alias,)
     db_aliases = settings.DATABASES if db_alias is None else (db_alias,)
     for db_alias in db_aliases:
         if no_tables:
@@ -70,19 +75,53 @@ def invalidate(
     :arg db_alias: Alias from the Django ``DATABASES`` setting
     :returns: Nothing
     """
+    if cache_alias is None:
+        # Also the transactions caches when `CACHALOT_CACHE` is None.
+        cache_aliases = dict.fromkeys(
+            [*settings.CACHES, cachalot_settings.CACHALOT_CACHE])
+    else:
+        cache_aliases = (cache_alias,)
+    _invalidate(list(_get_tables(tables_or_models)), cache_aliases, db_alias)
+
+
+def _invalidate_cachalot_cache(*tables_or_models, db_alias):
+    """
+    Invalidates ``tables_or_models`` in the cache storing the table
+    invalidations of ``CACHALOT_CACHE`` only.  When ``CACHALOT_CACHE`` is
+    ``None``, only the caches of the current transactions are invalidated.
+    """
+    _invalidate(list(_get_tables(tables_or_models)),
+                (_get_table_cache_alias(),), db_alias)
+
+
+def _invalidate(tables, cache_aliases, db_alias):
     send_signal = False
     invalidated = set()
+    real_caches = {}
+    tables_per_cache = defaultdict(dict)
+    batch = cachalot_caches.batch
     for cache_alias, db_alias, tables in _cache_db_tables_iterator(
-            list(_get_tables(tables_or_models)), cache_alias, db_alias):
+            tables, cache_aliases, db_alias):
         cache = cachalot_caches.get_cache(cache_alias, db_alias)
-        if not isinstance(cache, AtomicCache):
+        if isinstance(cache, AtomicCache):
+            _invalidate_tables(cache, db_alias, tables,
+                               _uses_versions(cache_alias))
+        elif batch is not None:
+            batch.add(cache_alias, db_alias, tables)
+        else:
             send_signal = True
-        _invalidate_tables(cache, db_alias, tables)
+            real_caches[cache_alias] = cache
+            tables_per_cache[cache_alias][db_alias] = tables
         invalidated.update(tables)
+    # All databases are invalidated at once in each cache.
+    for cache_alias, tables_per_db in tables_per_cache.items():
+        _invalidate_tables_per_db(real_caches[cache_alias], tables_per_db,
+                                  _uses_versions(cache_alias))
 
     if send_signal:
         for table in invalidated:
             post_invalidation.send(table, db_alias=db_alias)
+    cachalot_caches.check_batch()
 
 
 def get_last_invalidation(
@@ -101,6 +140,9 @@ def get_last_invalidation(
     If ``db_alias`` is specified, it only fetches invalidations
     for this database, otherwise invalidations for all databases are fetched.
 
+    Caches from ``CACHALOT_VERSIONED_CACHES`` are ignored, since they only
+    store version counters.
+
     :arg tables_or_models: SQL tables names, models or models lookups
                            (or a combination)
     :type tables_or_models: tuple of strings or models
@@ -109,8 +151,12 @@ def get_last_invalidation(
     :returns: The timestamp of the most recent invalidation
     """
     last_invalidation = 0.0
+    cache_aliases = (settings.CACHES if cache_alias is None
+                     else (cache_alias,))
     for cache_alias, db_alias, tables in _cache_db_tables_iterator(
-            list(_get_tables(tables_or_models)), cache_alias, db_alias):
+            list(_get_tables(tables_or_models)), cache_aliases, db_alias):
+        if _uses_versions(cache_alias):
+            continue
         get_table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN
         table_cache_keys = [get_table_cache_key(db_alias, t) for t in tables]
         invalidations = cachalot_caches.get_cache(
@@ -122,6 +168,93 @@ def get_last_invalidation(
     return last_invalidation
 
 
+def set_cache_timeout(queryset: QuerySet, timeout: Optional[float]) -> QuerySet:
+    """
+    Returns a copy of ``queryset`` whose SQL queries results are cached
+    during ``timeout`` seconds, instead of the timeout
+    from ``CACHALOT_TIMEOUT`` and ``CACHALOT_TABLE_TIMEOUTS``.
+
+    .. code-block:: python
+
+        recent = set_cache_timeout(Article.objects.order_by('-date'), 60)
+        list(recent[:10])  # Cached during 60 seconds.
+
+    :arg queryset: The queryset to copy
+    :arg timeout: Number of seconds, ``None`` means an infinite timeout
+    :returns: A copy of ``queryset``
+    """
+    queryset = queryset.all()
+    queryset.query.cachalot_timeout = timeout
+    return queryset
+
+
+@contextmanager
+def batch_invalidations(max_delay: Optional[float] = None,
+                        max_tables: Optional[int] = None):
+    """
+    Context manager or decorator collecting the invalidations of all the
+    writes made inside it, to send them in one go to the cache
+    when it exits, instead of before each SQL query modifying data.
+    The :data:`cachalot.signals.post_invalidation` signal is also sent
+    at that moment, once per table.
+
+    .. code-block:: python
+
+        with batch_invalidations(max_delay=1):
+            for row in rows:
+                Article.objects.create(**row)
+
+    Queries of the current thread immediately see the writes it made,
+    as they do not use the cache for the tables invalidated until
+    invalidations are sent, but other threads and processes can read
+    stale results until then.  They are also sent after a write or before
+    a query when the oldest collected invalidation is older than
+    ``max_delay`` seconds, or when at least ``max_tables`` tables
+    were invalidated.  Nesting this context manager has no effect.
+
+    :arg max_delay: Maximum number of seconds an invalidation is delayed
+    :arg max_tables: Maximum number of tables invalidated before sending
+                     the invalidations
+    """
+    is_outermost = cachalot_caches.enter_batch(max_delay, max_tables)
+    try:
+        yield
+    finally:
+        if is_outermost:
+            cachalot_caches.exit_batch()
+
+
+@contextmanager
+def memoize_cache_reads():
+    """
+    Context manager or decorator remembering the table invalidations
+    and query results read from the cache inside it, so that each
+    of them is fetched from the cache at most once.  This saves
+    round trips to the cache when a request or a task runs
+    the same queries several times.
+
+    .. code-block:: python
+
+        with memoize_cache_reads():
+            render_page(request)
+
+    Queries see the writes made inside the context manager, but not
+    the writes of other threads and processes until it exits.
+    The memo is bound to the current context, so it follows
+    the request in asynchronous views and is not shared
+    between concurrent tasks.  Nesting this context manager
+    reuses the outermost memo.
+    """
+    if memo_caches.get() is not None:
+        yield
+        return
+    token = memo_caches.set({})
+    try:
+        yield
+    finally:
+        memo_caches.reset(token)
+
+
 @contextmanager
 def cachalot_disabled(all_queries: bool = False):
     """
@@ -2,8 +2,10 @@ import copyreg
 from django.apps import AppConfig
 from django.conf import settings
 from django.core.checks import register, Tags, Warning, Error
+from django.utils.module_loading import import_string
 from cachalot.utils import ITERABLES
 
+from .backends import FetchFreshMixin
 from .settings import (
     cachalot_settings, SUPPORTED_CACHE_BACKENDS, SUPPORTED_DATABASE_ENGINES,
     SUPPORTED_ONLY)
@@ -11,15 +13,37 @@ from .settings import (
 
 @register(Tags.caches, Tags.compatibility)
 def check_cache_compatibility(app_configs, **kwargs):
-    cache = settings.CACHES[cachalot_settings.CACHALOT_CACHE]
-    cache_backend = cache['BACKEND']
-    if cache_backend not in SUPPORTED_CACHE_BACKENDS:
-        return [Warning(
-            'Cache backend %r is not supported by django-cachalot.'
-            % cache_backend,
-            hint='Switch to a supported cache backend '
-                 'like Redis or Memcached.',
-            id='cachalot.W001')]
+    if cachalot_settings.CACHALOT_CACHE is None:
+        return []
+    cache_aliases = dict.fromkeys([cachalot_settings.CACHALOT_CACHE,
+                                   cachalot_settings.CACHALOT_TABLE_CACHE])
+    for cache_alias in cache_aliases:
+        if cache_alias is None:
+            continue
+        cache_backend = settings.CACHES[cache_alias]['BACKEND']
+        if cache_backend not in SUPPORTED_CACHE_BACKENDS:
+            return [Warning(
+                'Cache backend %r is not supported by django-cachalot.'
+                % cache_backend,
+                hint='Switch to a supported cache backend '
+                     'like Redis or Memcached.',
+                id='cachalot.W001')]
+    if len(cache_aliases) > 1 and None not in cache_aliases:
+        cache_backend = settings.CACHES[
+            cachalot_settings.CACHALOT_CACHE]['BACKEND']
+        try:
+            backend_class = import_string(cache_backend)
+        except ImportError:
+            return []
+        if issubclass(backend_class, FetchFreshMixin):
+            return [Warning(
+                'Cache backend %r cannot validate query results on the '
+                'server when `CACHALOT_TABLE_CACHE` is another cache.'
+                % cache_backend,
+                hint='Remove `CACHALOT_TABLE_CACHE`, or use the Redis '
+                     'backend of Django or django-redis for '
+                     '`CACHALOT_CACHE`.',
+                id='cachalot.W005')]
     return []
 
 
@@ -0,0 +1,92 @@
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import SynchronousOnlyOperation
+
+from .cache import atomic_levels
+from .transaction import AtomicCache
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class MissingCacheKeys(Exception):
+    def __init__(self, cache, keys):
+        super().__init__(keys)
+        self.cache = cache
+        self.keys = keys
+
+
+class PrefetchedCache:
+    """
+    Read-only view of a cache restricted to the values fetched
+    asynchronously by :func:`call_with_async_cache`.
+
+    Reading keys that were not fetched yet raises ``MissingCacheKeys``,
+    any other operation raises ``CacheMiss``.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.fetched_keys = set()
+        self.values = {}
+
+    def get_many(self, keys):
+        missing_keys = [k for k in keys if k not in self.fetched_keys]
+        if missing_keys:
+            raise MissingCacheKeys(self, missing_keys)
+        values = self.values
+        return {k: values[k] for k in keys if k in values}
+
+    async def fetch(self, keys):
+        self.values.update(await self.cache.aget_many(keys))
+        self.fetched_keys.update(keys)
+
+    def __getattr__(self, name):
+        raise CacheMiss
+
+
+class AsyncCacheReads:
+    def __init__(self):
+        self.prefetched_caches = {}
+
+    def wrap(self, cache):
+        # Transactions have no asynchronous API.
+        if isinstance(cache, AtomicCache):
+            raise CacheMiss
+        prefetched_cache = self.prefetched_caches.get(id(cache))
+        if prefetched_cache is None:
+            prefetched_cache = self.prefetched_caches[id(cache)] = \
+                PrefetchedCache(cache)
+        return prefetched_cache
+
+
+async_cache_reads = ContextVar('cachalot_async_cache_reads', default=None)
+
+
+async def call_with_async_cache(func, *args, **kwargs):
+    """
+    Calls ``func`` directly in the event loop, fetching the cache keys
+    it needs with the asynchronous cache API, as long as all its SQL queries
+    are found in the cache.  Otherwise, ``func`` is called again
+    in a thread, like Django does for asynchronous queryset methods.
+
+    Inside a transaction of the thread calling ``async_to_sync``, ``func``
+    is directly called in that thread, the only one seeing its atomic caches.
+    """
+    if atomic_levels.get() > 0:
+        return await sync_to_async(func)(*args, **kwargs)
+    reads = AsyncCacheReads()
+    token = async_cache_reads.set(reads)
+    try:
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except MissingCacheKeys as e:
+                await e.cache.fetch(e.keys)
+            except (CacheMiss, SynchronousOnlyOperation):
+                break
+    finally:
+        async_cache_reads.reset(token)
+    return await sync_to_async(func)(*args, **kwargs)
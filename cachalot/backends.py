@@ -0,0 +1,221 @@
+"""
+Shortcuts taken with some cache backends to save round trips,
+and Redis caches validating query results on the server.
+"""
+
+import pickle
+
+try:
+    from django.core.cache.backends.redis import (
+        RedisCache, RedisSerializer as BaseRedisSerializer,
+    )
+except ImportError:  # Django < 4.0
+    RedisCache = BaseRedisSerializer = None
+
+try:
+    from django_redis.cache import RedisCache as DjangoRedisCache
+    from django_redis.serializers.pickle import PickleSerializer
+except ImportError:
+    DjangoRedisCache = PickleSerializer = None
+
+
+# Returns the cached result of KEYS[#KEYS] followed by the values of the
+# tables in KEYS.  If the result is stale, only its stamp is returned.
+# Results are stored as `=<timestamp>\n<pickle>` or `#<v1>,<v2>…\n<pickle>`,
+# versions being sorted by table cache key.
+FETCH_FRESH_SCRIPT = """
+local values = redis.call('MGET', unpack(KEYS))
+local cached = table.remove(values)
+if not cached then
+    return {false, unpack(values)}
+end
+local kind = string.sub(cached, 1, 1)
+local newline = string.find(cached, '\\n', 1, true)
+if newline and (kind == '=' or kind == '#') then
+    local header = string.sub(cached, 2, newline - 1)
+    local fresh = true
+    if kind == '=' then
+        local stamp = tonumber(header)
+        for i = 1, #values do
+            local invalidation = values[i] and tonumber(values[i])
+            if not invalidation or invalidation > stamp then
+                fresh = false
+                break
+            end
+        end
+    else
+        local i = 0
+        for version in string.gmatch(header, '[^,]+') do
+            i = i + 1
+            if values[i] ~= version then
+                fresh = false
+                break
+            end
+        end
+        fresh = fresh and i == #values
+    end
+    if not fresh then
+        cached = string.sub(cached, 1, newline - 1)
+    end
+end
+return {cached, unpack(values)}
+"""
+
+
+def get_redis_client(cache):
+    """
+    Returns the Redis client of ``cache`` and the function making
+    its Redis keys, or ``(None, None)`` if ``cache`` does not use Redis.
+    """
+    if RedisCache is not None and isinstance(cache, RedisCache):
+        return (cache._cache.get_client(write=True),
+                cache.make_and_validate_key)
+    if DjangoRedisCache is not None and isinstance(cache, DjangoRedisCache):
+        return cache.client.get_client(write=True), cache.client.make_key
+    return None, None
+
+
+def incr_versions(cache, keys, timeout, get_new_version):
+    """
+    Increments the version counters ``keys`` in a single round trip,
+    creating the missing ones from ``get_new_version()``.
+
+    Returns ``False`` if the backend of ``cache`` cannot do it,
+    counters must then be incremented one by one.
+    """
+    client, make_key = get_redis_client(cache)
+    if client is None:
+        return False
+    expiry = None if timeout is None else max(1, int(timeout))
+    # MULTI/EXEC, so that a counter is never seen without its increment.
+    pipeline = client.pipeline()
+    for key in keys:
+        key = make_key(key)
+        pipeline.set(key, get_new_version(), nx=True, ex=expiry)
+        pipeline.incr(key)
+    pipeline.execute()
+    return True
+
+
+def _dump_stamp(stamp):
+    if stamp.__class__ is float:
+        return b'=' + repr(stamp).encode()
+    if stamp.__class__ is tuple \
+            and all(version.__class__ is int for version in stamp):
+        return b'#' + ','.join(map(str, stamp)).encode()
+
+
+def _load_stamp(header):
+    if header[:1] == b'=':
+        return float(header[1:])
+    return tuple(int(version) for version in header[1:].split(b',')
+                 if version)
+
+
+class StampedSerializerMixin:
+    """
+    Stores timestamps as numbers and the stamp of each query result
+    in clear, so that the freshness of results can be checked by Redis.
+    """
+
+    def dumps(self, obj):
+        if obj.__class__ is float:
+            return repr(obj).encode()
+        if obj.__class__ is tuple and len(obj) == 2:
+            header = _dump_stamp(obj[0])
+            if header is not None:
+                return header + b'\n' + self.dumps_payload(obj[1])
+        return super().dumps(obj)
+
+    def loads(self, data):
+        if data[:1] in (b'=', b'#'):
+            header, newline, payload = data.partition(b'\n')
+            # Stale results are fetched without their payload.
+            return (_load_stamp(header),
+                    pickle.loads(payload) if newline else None)
+        try:
+            return int(data)
+        except ValueError:
+            pass
+        try:
+            return float(data)
+        except ValueError:
+            return pickle.loads(data)
+
+
+class FetchFreshMixin:
+    """
+    Fetches a query result with the values of its tables in a single
+    atomic round trip, without transferring the result if it is stale.
+    """
+
+    _fetch_fresh_script = None
+
+    def get_fresh_many(self, cache_key, table_cache_keys):
+        """
+        Works like ``get_many(table_cache_keys + [cache_key])``,
+        except that the value of ``cache_key`` is ``(stamp, None)``
+        if the result is stale.
+        """
+        client = self._get_redis_client()
+        if self._fetch_fresh_script is None:
+            self._fetch_fresh_script = client.register_script(
+                FETCH_FRESH_SCRIPT)
+        # Versions are compared in the order of `_get_versions`.
+        keys = sorted(table_cache_keys) + [cache_key]
+        cached, *values = self._fetch_fresh_script(
+            keys=[self._make_redis_key(key) for key in keys], client=client)
+        values.append(cached)
+        return {key: self._loads(value) for key, value in zip(keys, values)
+                if value is not None}
+
+
+if RedisCache is not None:
+    class RedisSerializer(StampedSerializerMixin, BaseRedisSerializer):
+        def dumps_payload(self, obj):
+            return pickle.dumps(obj, self.protocol)
+
+    class CachalotRedisCache(FetchFreshMixin, RedisCache):
+        """
+        Django Redis cache validating cachalot results on the server.
+        """
+
+        def __init__(self, server, params):
+            super().__init__(server, params)
+            self._options.setdefault(
+                'serializer', 'cachalot.backends.RedisSerializer')
+
+        def _get_redis_client(self):
+            return self._cache.get_client()
+
+        def _make_redis_key(self, key):
+            return self.make_and_validate_key(key)
+
+        def _loads(self, value):
+            return self._cache._serializer.loads(value)
+
+
+if DjangoRedisCache is not None:
+    class DjangoRedisSerializer(StampedSerializerMixin, PickleSerializer):
+        def dumps_payload(self, obj):
+            return pickle.dumps(obj, self._pickle_version)
+
+    class CachalotDjangoRedisCache(FetchFreshMixin, DjangoRedisCache):
+        """
+        django-redis cache validating cachalot results on the server.
+        """
+
+        def __init__(self, server, params):
+            params = {**params, 'OPTIONS': {
+                'SERIALIZER': 'cachalot.backends.DjangoRedisSerializer',
+                **params.get('OPTIONS', {})}}
+            super().__init__(server, params)
+
+        def _get_redis_client(self):
+            return self.client.get_client(write=False)
+
+        def _make_redis_key(self, key):
+            return self.client.make_key(key)
+
+        def _loads(self, value):
+            return self.client.decode(value)
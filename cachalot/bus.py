@@ -0,0 +1,254 @@
+"""
+Broadcasts invalidations to the other processes, so that they evict
+the results of their local caches without waiting for them to be validated.
+"""
+
+import json
+import logging
+import os
+import socket
+from threading import Event, Lock, Thread
+from uuid import uuid4
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+from .backends import get_redis_client
+from .local_cache import local_result_cache, local_table_cache
+from .settings import cachalot_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseTransport:
+    """
+    Sends messages to all the processes listening, including the sender.
+    """
+
+    # Maximum size of a message in bytes, or None if it has no limit.
+    max_message_size = None
+
+    def publish(self, message):
+        raise NotImplementedError
+
+    def listen(self, callback, stop):
+        """
+        Calls ``callback`` with each message received, until ``stop`` is set.
+        """
+        raise NotImplementedError
+
+
+class RedisTransport(BaseTransport):
+    """
+    Redis pub/sub, using the connection of a Redis cache.
+    """
+
+    def __init__(self, channel='cachalot', cache_alias=None):
+        self.channel = channel
+        self.cache_alias = cache_alias
+
+    def get_client(self):
+        client, _ = get_redis_client(
+            caches[self.cache_alias or cachalot_settings.CACHALOT_CACHE])
+        if client is None:
+            raise ImproperlyConfigured(
+                'RedisTransport requires a Redis cache backend.')
+        return client
+
+    def publish(self, message):
+        self.get_client().publish(self.channel, message)
+
+    def listen(self, callback, stop):
+        pubsub = self.get_client().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        try:
+            while not stop.is_set():
+                message = pubsub.get_message(timeout=0.5)
+                if message is not None:
+                    callback(message['data'])
+        finally:
+            pubsub.close()
+
+
+class UnixSocketTransport(BaseTransport):
+    """
+    Datagrams sent to a socket per listening process in ``path``,
+    for processes running on the same host.
+    """
+
+    # The default maximum size of datagrams on macOS, Linux accepts more.
+    max_message_size = 2048
+
+    def __init__(self, path='/tmp/cachalot-bus'):
+        self.path = path
+
+    def publish(self, message):
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            for name in names:
+                address = os.path.join(self.path, name)
+                try:
+                    sock.sendto(message, address)
+                except ConnectionRefusedError:
+                    # The process listening on it died.
+                    try:
+                        os.unlink(address)
+                    except FileNotFoundError:
+                        pass
+                except (BlockingIOError, FileNotFoundError):
+                    pass
+                except OSError:
+                    logger.warning('Cannot send invalidations to %s.',
+                                   address, exc_info=True)
+
+    def listen(self, callback, stop):
+        os.makedirs(self.path, exist_ok=True)
+        address = os.path.join(self.path,
+                               '%s-%s.sock' % (os.getpid(), uuid4().hex))
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.bind(address)
+            sock.settimeout(0.5)
+            try:
+                while not stop.is_set():
+                    try:
+                        message = sock.recv(self.max_message_size)
+                    except socket.timeout:
+                        continue
+                    callback(message)
+            finally:
+                os.unlink(address)
+
+
+class InvalidationBus:
+    """
+    Publishes the table cache keys invalidated by this process
+    through ``CACHALOT_INVALIDATION_BUS``, and invalidates them
+    in the connected local caches when other processes publish them.
+    """
+
+    def __init__(self):
+        self._sender = None
+        self._sender_pid = None
+        self.local_caches = []
+        self._lock = Lock()
+        self._settings = None
+        self._transport = None
+        self._pid = None
+        self._stop = None
+
+    @property
+    def sender(self):
+        """
+        Identifies the messages of the current process.  A forked process
+        gets a new one, otherwise it would ignore the messages of its
+        parent and siblings as its own.
+        """
+        if self._sender_pid != os.getpid():
+            with self._lock:
+                if self._sender_pid != os.getpid():
+                    self._sender = uuid4().hex
+                    self._sender_pid = os.getpid()
+        return self._sender
+
+    def connect(self, local_cache):
+        """
+        Invalidates ``local_cache`` when other processes invalidate tables.
+        It needs ``invalidate(table_cache_keys)`` and ``clear()`` methods.
+        """
+        self.local_caches.append(local_cache)
+
+    def get_transport(self):
+        settings = (cachalot_settings.CACHALOT_INVALIDATION_BUS,
+                    cachalot_settings.CACHALOT_INVALIDATION_BUS_OPTIONS)
+        if settings != self._settings:
+            with self._lock:
+                if settings != self._settings:
+                    self.stop()
+                    transport_class, options = settings
+                    self._transport = (None if transport_class is None
+                                       else transport_class(**options))
+                    self._settings = settings
+        return self._transport
+
+    def publish(self, table_cache_keys):
+        transport = self.get_transport()
+        if transport is None:
+            return
+        for message in self._get_messages(list(table_cache_keys),
+                                          transport.max_message_size):
+            transport.publish(message)
+
+    def _get_messages(self, table_cache_keys, max_size):
+        """
+        Splits the invalidation of ``table_cache_keys`` into messages
+        of at most ``max_size`` bytes.
+        """
+        message = json.dumps({
+            'sender': self.sender, 'keys': table_cache_keys,
+        }).encode()
+        if max_size is None or len(message) <= max_size:
+            return [message]
+        if len(table_cache_keys) <= 1:
+            # Other processes clear their local caches instead.
+            return [json.dumps({'sender': self.sender, 'keys': None}).encode()]
+        middle = len(table_cache_keys) // 2
+        return (self._get_messages(table_cache_keys[:middle], max_size)
+                + self._get_messages(table_cache_keys[middle:], max_size))
+
+    def listen(self):
+        """
+        Starts listening to other processes in a thread,
+        if it was not already started by the current process.
+        """
+        transport = self.get_transport()
+        if transport is None or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # After a fork, the thread of the parent process is gone.
+            self._pid = os.getpid()
+            self._stop = Event()
+            Thread(target=self._run, args=(transport, self._stop),
+                   name='cachalot-invalidation-bus', daemon=True).start()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+        self._pid = self._stop = None
+
+    def receive(self, message):
+        try:
+            message = json.loads(message)
+            if message['sender'] == self.sender:
+                return
+            table_cache_keys = message['keys']
+            if table_cache_keys is not None:
+                table_cache_keys = list(table_cache_keys)
+        except (ValueError, KeyError, TypeError):
+            return
+        for local_cache in self.local_caches:
+            if table_cache_keys is None:
+                local_cache.clear()
+            else:
+                local_cache.invalidate(table_cache_keys)
+
+    def _run(self, transport, stop):
+        while not stop.is_set():
+            try:
+                transport.listen(self.receive, stop)
+            except Exception:
+                # Messages may have been lost while disconnected.
+                for local_cache in self.local_caches:
+                    local_cache.clear()
+                stop.wait(1)
+
+
+invalidation_bus = InvalidationBus()
+invalidation_bus.connect(local_result_cache)
+invalidation_bus.connect(local_table_cache)
@@ -1,15 +1,118 @@
 from collections import defaultdict
+from contextvars import ContextVar
 from threading import local
+from time import time
 
+from django.conf import settings
 from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
 from django.db import DEFAULT_DB_ALIAS
 
+from .memo import MemoCache, memo_caches
 from .settings import cachalot_settings
 from .signals import post_invalidation
 from .transaction import AtomicCache
 
 
+class InvalidationBatch:
+    """
+    Invalidations collected by :func:`cachalot.api.batch_invalidations`
+    until they are flushed to the real caches.
+    """
+
+    def __init__(self, max_delay, max_tables):
+        self.max_delay = max_delay
+        self.max_tables = max_tables
+        # Tables invalidated per cache alias and database.
+        self.tables = defaultdict(dict)
+        # Cache keys of these tables, whose queries must not use the cache
+        # until invalidations are flushed, so that they see the writes.
+        self.table_cache_keys = set()
+        self.invalidated_at = None
+
+    def add(self, cache_alias, db_alias, tables):
+        if not tables:
+            return
+        if self.invalidated_at is None:
+            self.invalidated_at = time()
+        self.tables[cache_alias].setdefault(db_alias, set()).update(tables)
+        get_table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN
+        self.table_cache_keys.update(get_table_cache_key(db_alias, table)
+                                     for table in tables)
+
+
+# Invalidation batch of the current context.  Unlike `CacheHandler.batch`,
+# it is seen by asynchronous code called from the current thread
+# with `async_to_sync`, which must not read the invalidated tables.
+current_batch = ContextVar('cachalot_current_batch', default=None)
+
+# Below transactions when `CACHALOT_CACHE` is None, so that results
+# are only cached until the outermost transaction ends.
+null_cache = DummyCache('', {})
+
+
+class SplitCache:
+    """
+    Stores the invalidations of ``table_cache_keys`` in ``table_cache``,
+    and all the other keys, like query results, in ``result_cache``
+    (see ``CACHALOT_TABLE_CACHE``).
+    """
+
+    def __init__(self, table_cache, result_cache, table_cache_keys):
+        self.table_cache = table_cache
+        self.result_cache = result_cache
+        self.table_cache_keys = frozenset(table_cache_keys)
+
+    def _get_cache(self, key):
+        if key in self.table_cache_keys:
+            return self.table_cache
+        return self.result_cache
+
+    def get(self, key, default=None):
+        return self._get_cache(key).get(key, default)
+
+    def get_many(self, keys):
+        table_keys = [k for k in keys if k in self.table_cache_keys]
+        data = self.table_cache.get_many(table_keys) if table_keys else {}
+        if len(table_keys) < len(keys):
+            data.update(self.result_cache.get_many(
+                [k for k in keys if k not in self.table_cache_keys]))
+        return data
+
+    def set_many(self, data, timeout):
+        table_data = {k: v for k, v in data.items()
+                      if k in self.table_cache_keys}
+        failed_keys = []
+        if table_data:
+            failed_keys += self.table_cache.set_many(table_data, timeout) or []
+        if len(table_data) < len(data):
+            failed_keys += self.result_cache.set_many(
+                {k: v for k, v in data.items()
+                 if k not in self.table_cache_keys}, timeout) or []
+        return failed_keys
+
+    def add(self, key, value, timeout):
+        return self._get_cache(key).add(key, value, timeout)
+
+    def incr(self, key, delta=1):
+        return self._get_cache(key).incr(key, delta)
+
+    def delete(self, key):
+        return self._get_cache(key).delete(key)
+
+    def __getattr__(self, name):
+        return getattr(self.result_cache, name)
+
+
+# Number of atomic cache levels opened by the current context.  Unlike
+# the atomic caches, it is seen by asynchronous code called from the current
+# thread with `async_to_sync`, which must then read from this thread.
+atomic_levels = ContextVar('cachalot_atomic_levels', default=0)
+
+
 class CacheHandler(local):
+    batch = None
+
     @property
     def atomic_caches(self):
         if not hasattr(self, '_atomic_caches'):
@@ -19,7 +122,8 @@ class CacheHandler(local):
     def get_atomic_cache(self, cache_alias, db_alias, level):
         if cache_alias not in self.atomic_caches[db_alias][level]:
             self.atomic_caches[db_alias][level][cache_alias] = AtomicCache(
-                self.get_cache(cache_alias, db_alias, level-1), db_alias)
+                self.get_cache(cache_alias, db_alias, level-1), db_alias,
+                cache_alias in cachalot_settings.CACHALOT_VERSIONED_CACHES)
         return self.atomic_caches[db_alias][level][cache_alias]
 
     def get_cache(self, cache_alias=None, db_alias=None, atomic_level=-1):
@@ -30,27 +134,99 @@ class CacheHandler(local):
 
         min_level = -len(self.atomic_caches[db_alias])
         if atomic_level < min_level:
-            return caches[cache_alias]
+            return self.get_real_cache(cache_alias)
         return self.get_atomic_cache(cache_alias, db_alias, atomic_level)
 
+    def get_real_cache(self, cache_alias):
+        """Returns the cache used outside transactions."""
+        if cache_alias is None:
+            return null_cache
+        memos = memo_caches.get()
+        if memos is None:
+            return caches[cache_alias]
+        if cache_alias not in memos:
+            memos[cache_alias] = MemoCache(caches[cache_alias])
+        return memos[cache_alias]
+
     def enter_atomic(self, db_alias):
         if db_alias is None:
             db_alias = DEFAULT_DB_ALIAS
         self.atomic_caches[db_alias].append({})
+        atomic_levels.set(atomic_levels.get() + 1)
 
     def exit_atomic(self, db_alias, commit):
         if db_alias is None:
             db_alias = DEFAULT_DB_ALIAS
-        atomic_caches = self.atomic_caches[db_alias].pop().values()
+        atomic_caches = self.atomic_caches[db_alias].pop()
+        atomic_levels.set(atomic_levels.get() - 1)
         if commit:
+            is_outermost = not self.atomic_caches[db_alias]
+            # The current batch collects the invalidations
+            # of the outermost transaction.
+            batch = self.batch if is_outermost else None
             to_be_invalidated = set()
-            for atomic_cache in atomic_caches:
-                atomic_cache.commit()
+            for cache_alias, atomic_cache in atomic_caches.items():
+                if batch is not None:
+                    batch.add(cache_alias, db_alias,
+                              atomic_cache.to_be_invalidated)
+                atomic_cache.commit(invalidate=batch is None)
                 to_be_invalidated.update(atomic_cache.to_be_invalidated)
-            # This happens when committing the outermost atomic block.
-            if not self.atomic_caches[db_alias]:
+            if is_outermost and batch is None:
                 for table in to_be_invalidated:
                     post_invalidation.send(table, db_alias=db_alias)
 
+    def enter_batch(self, max_delay=None, max_tables=None):
+        """
+        Starts collecting invalidations of all databases, unless this is
+        already done.  Returns whether :meth:`exit_batch` must be called.
+        """
+        if self.batch is not None:
+            return False
+        self.batch = InvalidationBatch(max_delay, max_tables)
+        current_batch.set(self.batch)
+        return True
+
+    def exit_batch(self):
+        self.flush_batch()
+        self.batch = None
+        current_batch.set(None)
+
+    def flush_batch(self):
+        """
+        Sends the invalidations collected by the current batch
+        to the real caches.
+        """
+        # We import this here to avoid a circular import issue.
+        from .utils import _invalidate_tables_per_db, _uses_versions
+
+        batch = self.batch
+        tables_per_cache = batch.tables
+        batch.tables = defaultdict(dict)
+        batch.table_cache_keys = set()
+        batch.invalidated_at = None
+        invalidated = set()
+        for cache_alias, tables_per_db in tables_per_cache.items():
+            _invalidate_tables_per_db(
+                self.get_real_cache(cache_alias), tables_per_db,
+                _uses_versions(cache_alias))
+            for db_alias, tables in tables_per_db.items():
+                invalidated.update((db_alias, table) for table in tables)
+        for db_alias, table in invalidated:
+            post_invalidation.send(table, db_alias=db_alias)
+
+    def check_batch(self):
+        """
+        Flushes the current batch if it reached one of its limits.
+        It is checked after each write and before each query.
+        """
+        batch = self.batch
+        if batch is None or batch.invalidated_at is None:
+            return
+        if (batch.max_delay is not None
+                and time() - batch.invalidated_at >= batch.max_delay) \
+                or (batch.max_tables is not None
+                    and len(batch.table_cache_keys) >= batch.max_tables):
+            self.flush_batch()
+
 
 cachalot_caches = CacheHandler()
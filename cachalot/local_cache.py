@@ -0,0 +1,133 @@
+from collections import OrderedDict, defaultdict
+from pickle import dumps, HIGHEST_PROTOCOL
+from threading import Lock
+from time import time
+
+from .settings import cachalot_settings
+
+
+class LocalResultCache:
+    """
+    Bounded, process-local LRU of query results sitting in front of
+    ``CACHALOT_CACHE``.
+
+    Entries are never trusted blindly: they are validated against the table
+    invalidation timestamps (or versions) of the shared cache, unless they
+    were validated less than ``CACHALOT_LOCAL_CACHE_STALENESS`` seconds ago.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._keys_per_table = defaultdict(set)
+        self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+            return entry
+
+    def set(self, cache_key, table_cache_keys, stamp, result,
+            expires_at=None):
+        max_size = cachalot_settings.CACHALOT_LOCAL_CACHE_MAX_SIZE
+        try:
+            size = len(dumps(result, HIGHEST_PROTOCOL))
+        except Exception:
+            return
+        if size > max_size:
+            return
+        # [stamp, result, table_cache_keys, size, validated_at, expires_at]
+        entry = [stamp, result, tuple(table_cache_keys), size, time(),
+                 expires_at]
+        with self._lock:
+            self._pop(cache_key)
+            self._entries[cache_key] = entry
+            for table_cache_key in entry[2]:
+                self._keys_per_table[table_cache_key].add(cache_key)
+            self.size += size
+            while self.size > max_size:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, cache_key):
+        with self._lock:
+            self._pop(cache_key)
+
+    def invalidate(self, table_cache_keys):
+        with self._lock:
+            for table_cache_key in table_cache_keys:
+                for cache_key in self._keys_per_table.pop(table_cache_key, ()):
+                    self._pop(cache_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_per_table.clear()
+            self.size = 0
+
+    def _pop(self, cache_key):
+        entry = self._entries.pop(cache_key, None)
+        if entry is None:
+            return
+        self.size -= entry[3]
+        for table_cache_key in entry[2]:
+            cache_keys = self._keys_per_table.get(table_cache_key)
+            if cache_keys is not None:
+                cache_keys.discard(cache_key)
+                if not cache_keys:
+                    del self._keys_per_table[table_cache_key]
+
+
+class LocalTableCache:
+    """
+    Process-local copy of the table invalidation timestamps (or versions)
+    of ``CACHALOT_CACHE``, each trusted for
+    ``CACHALOT_LOCAL_TABLE_CACHE_STALENESS`` seconds after it was fetched.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._values = {}
+        # Incremented by each invalidation, so that values fetched
+        # before it are not stored after it.
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def get_many(self, table_cache_keys):
+        staleness = cachalot_settings.CACHALOT_LOCAL_TABLE_CACHE_STALENESS
+        min_fetched_at = time() - staleness
+        values = {}
+        with self._lock:
+            for table_cache_key in table_cache_keys:
+                entry = self._values.get(table_cache_key)
+                if entry is not None and entry[1] > min_fetched_at:
+                    values[table_cache_key] = entry[0]
+        return values
+
+    def set_many(self, values, fetched_at, invalidations):
+        with self._lock:
+            if invalidations != self.invalidations:
+                return
+            for table_cache_key, value in values.items():
+                self._values[table_cache_key] = (value, fetched_at)
+
+    def invalidate(self, table_cache_keys):
+        with self._lock:
+            self.invalidations += 1
+            for table_cache_key in table_cache_keys:
+                self._values.pop(table_cache_key, None)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += 1
+            self._values.clear()
+
+
+local_result_cache = LocalResultCache()
+local_table_cache = LocalTableCache()
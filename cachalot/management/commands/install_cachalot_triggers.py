@@ -0,0 +1,54 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from ...api import _get_tables
+from ...postgres import CHANNEL, install_triggers, uninstall_triggers
+
+
+class Command(BaseCommand):
+    help = ('Installs PostgreSQL triggers notifying django-cachalot '
+            'of the tables modified outside Django.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('table_or_app_label[.model_name]', nargs='*')
+        parser.add_argument(
+            '-d', '--db', action='store', dest='db_alias',
+            default=DEFAULT_DB_ALIAS, choices=list(settings.DATABASES.keys()),
+            help='Database alias from the DATABASES setting.')
+        parser.add_argument(
+            '--channel', action='store', dest='channel', default=CHANNEL,
+            help='Channel of the notifications.')
+        parser.add_argument(
+            '--uninstall', action='store_true', dest='uninstall',
+            help='Removes the triggers instead.')
+
+    def handle(self, *args, **options):
+        db_alias = options['db_alias']
+        verbosity = int(options['verbosity'])
+        labels = options['table_or_app_label[.model_name]']
+
+        connection = connections[db_alias]
+        if connection.vendor != 'postgresql':
+            raise CommandError("Database '%s' is not PostgreSQL." % db_alias)
+
+        tables = []
+        for label in labels:
+            try:
+                tables.extend(model._meta.db_table for model
+                              in apps.get_app_config(label).get_models())
+            except LookupError:
+                tables.extend(_get_tables([label]))
+        if not labels:
+            tables = connection.introspection.table_names()
+
+        if options['uninstall']:
+            uninstall_triggers(tables, db_alias)
+            action = 'Removed'
+        else:
+            install_triggers(tables, db_alias, options['channel'])
+            action = 'Installed'
+        if verbosity > 0:
+            self.stdout.write("%s triggers on %s tables of database '%s'."
+                              % (action, len(tables), db_alias))
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from ...postgres import CHANNEL, PostgresListener
+
+
+class Command(BaseCommand):
+    help = ('Invalidates the tables notified by the PostgreSQL triggers '
+            'of install_cachalot_triggers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-d', '--db', action='store', dest='db_alias',
+            default=DEFAULT_DB_ALIAS, choices=list(settings.DATABASES.keys()),
+            help='Database alias from the DATABASES setting.')
+        parser.add_argument(
+            '--channel', action='store', dest='channel', default=CHANNEL,
+            help='Channel of the notifications.')
+        parser.add_argument(
+            '--max-delay', action='store', dest='max_delay', type=float,
+            default=0.1,
+            help='Seconds during which notified tables are collected '
+                 'before invalidating them at once.')
+
+    def handle(self, *args, **options):
+        if int(options['verbosity']) > 0:
+            self.stdout.write("Listening to database '%s'..."
+                              % options['db_alias'])
+        listener = PostgresListener(options['db_alias'], options['channel'],
+                                    options['max_delay'])
+        try:
+            listener.run()
+        except KeyboardInterrupt:
+            listener.stop()
@@ -0,0 +1,90 @@
+from contextvars import ContextVar
+
+
+class MemoCache:
+    """
+    Cache remembering the values read from or written to ``cache``,
+    so that a request reading the same table invalidation timestamps
+    or query results several times only fetches them once.
+
+    Writes are sent to ``cache`` immediately, so the current scope
+    always sees its own invalidations, but invalidations made by other
+    threads or processes are not seen until the scope ends.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.values = {}
+
+    def get(self, key, default=None):
+        if key in self.values:
+            return self.values[key]
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        values = self.values
+        data = {k: values[k] for k in keys if k in values}
+        if len(data) < len(keys):
+            fetched = self.cache.get_many([k for k in keys if k not in data])
+            values.update(fetched)
+            data.update(fetched)
+        return data
+
+    async def aget_many(self, keys):
+        values = self.values
+        data = {k: values[k] for k in keys if k in values}
+        if len(data) < len(keys):
+            fetched = await self.cache.aget_many(
+                [k for k in keys if k not in data])
+            values.update(fetched)
+            data.update(fetched)
+        return data
+
+    def get_fresh_many(self, cache_key, table_cache_keys):
+        values = self.values
+        keys = [*table_cache_keys, cache_key]
+        if all(k in values for k in keys):
+            return {k: values[k] for k in keys}
+        data = self.cache.get_fresh_many(cache_key, table_cache_keys)
+        values.update((k, data[k]) for k in table_cache_keys if k in data)
+        # Stale results are not transferred, so they are not remembered.
+        cached = data.get(cache_key)
+        if cached is not None and cached[1] is not None:
+            values[cache_key] = cached
+        return data
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout)
+        self.values[key] = value
+
+    def set_many(self, data, timeout):
+        failed_keys = self.cache.set_many(data, timeout)
+        self.values.update(data)
+        return failed_keys
+
+    def add(self, key, value, timeout):
+        added = self.cache.add(key, value, timeout)
+        if added:
+            self.values[key] = value
+        return added
+
+    def incr(self, key, delta=1):
+        value = self.cache.incr(key, delta)
+        self.values[key] = value
+        return value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+        return self.cache.delete(key)
+
+    def forget(self, keys):
+        """Reads ``keys`` from ``cache`` again next time."""
+        for key in keys:
+            self.values.pop(key, None)
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+
+# Memo caches of the current scope, per cache alias.
+memo_caches = ContextVar('cachalot_memo_caches', default=None)
@@ -0,0 +1,56 @@
+try:
+    from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+except ImportError:  # asgiref < 3.6
+    from asyncio import coroutines, iscoroutinefunction
+
+    def markcoroutinefunction(func):
+        func._is_coroutine = coroutines._is_coroutine
+        return func
+
+from .api import batch_invalidations, memoize_cache_reads
+
+
+class InvalidationBatchMiddleware:
+    """
+    Sends the invalidations of each request in one go at the end
+    of the request, using :func:`cachalot.api.batch_invalidations`.
+
+    Subclasses can set ``max_delay`` and ``max_tables`` to send them earlier.
+    """
+
+    max_delay = None
+    max_tables = None
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with batch_invalidations(self.max_delay, self.max_tables):
+            return self.get_response(request)
+
+
+class CacheReadsMemoMiddleware:
+    """
+    Fetches each table invalidation and query result at most once
+    per request, using :func:`cachalot.api.memoize_cache_reads`.
+
+    Works in both WSGI and ASGI projects.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with memoize_cache_reads():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with memoize_cache_reads():
+            return await self.get_response(request)
@@ -2,26 +2,47 @@ import re
 import types
 from collections.abc import Iterable
 from functools import wraps
-from time import time
+from time import sleep, time
 
 from django.core.exceptions import EmptyResultSet
 from django.db.backends.utils import CursorWrapper
+from django.db.models import QuerySet
 from django.db.models.signals import post_migrate
 from django.db.models.sql.compiler import (
     SQLCompiler, SQLInsertCompiler, SQLUpdateCompiler, SQLDeleteCompiler,
 )
 from django.db.transaction import Atomic, get_connection
 
-from .api import invalidate, LOCAL_STORAGE
-from .cache import cachalot_caches
+from .admission import miss_sketch
+from .api import _invalidate_cachalot_cache, LOCAL_STORAGE
+from .async_cache import (
+    CacheMiss, PrefetchedCache, async_cache_reads, call_with_async_cache,
+)
+from .backends import FetchFreshMixin
+from .bus import invalidation_bus
+from .cache import SplitCache, cachalot_caches, current_batch
+from .local_cache import local_result_cache, local_table_cache
+from .memo import MemoCache
+from .serializers import (
+    ChunkedResult, PickledResult, join_result, split_result)
 from .settings import cachalot_settings, ITERABLES
+from .single_flight import flights
+from .transaction import AtomicCache
 from .utils import (
-    _get_table_cache_keys, _get_tables_from_sql,
+    _add_table_versions, _clear_memos, _get_table_cache_key_setting,
+    _get_generational_cache_key, _get_table_cache_alias, _get_table_cache_keys,
+    _get_table_setting_values, _get_tables_from_sql, _get_timeout,
+    _get_versions, _is_fresh, _uses_versions,
     UncachableQuery, is_cachable, filter_cachable,
 )
 
 
 WRITE_COMPILERS = (SQLInsertCompiler, SQLUpdateCompiler, SQLDeleteCompiler)
+# Asynchronous queryset methods only reading data.
+ASYNC_READ_METHODS = (
+    'aaggregate', 'acount', 'aget', 'aearliest', 'alatest', 'afirst', 'alast',
+    'ain_bulk', 'aexists', 'acontains',
+)
 
 SQL_DATA_CHANGE_RE = re.compile(
     '|'.join([
@@ -41,27 +62,148 @@ def _unset_raw_connection(original):
     return inner
 
 
-def _get_result_or_execute_query(execute_query_func, cache,
-                                 cache_key, table_cache_keys):
+def _get_result_cache(cache):
+    if cache.__class__ is SplitCache:
+        return cache.result_cache
+    return cache
+
+
+def _fetches_fresh(cache):
+    if cache.__class__ is MemoCache:
+        cache = cache.cache
+    return isinstance(cache, FetchFreshMixin)
+
+
+def _without_memo(cache, cache_key):
+    """
+    Returns ``cache`` reading and writing directly to the real caches,
+    forgetting ``cache_key`` so that it is read there next time.
+    """
+    if cache.__class__ is SplitCache:
+        return SplitCache(_without_memo(cache.table_cache, cache_key),
+                          _without_memo(cache.result_cache, cache_key),
+                          cache.table_cache_keys)
+    if cache.__class__ is MemoCache:
+        cache.forget([cache_key])
+        return cache.cache
+    return cache
+
+
+def _get_many(cache, table_cache_keys, keys=()):
+    """
+    Fetches ``keys`` and the invalidations of ``table_cache_keys``,
+    reading the latter from the local table cache when it is enabled.
+    """
+    if cachalot_settings.CACHALOT_LOCAL_TABLE_CACHE_STALENESS <= 0 \
+            or isinstance(_get_result_cache(cache), AtomicCache):
+        return cache.get_many([*table_cache_keys, *keys])
+    invalidations = local_table_cache.invalidations
+    fetched_at = time()
+    data = local_table_cache.get_many(table_cache_keys)
+    missing_keys = [k for k in table_cache_keys if k not in data]
+    if missing_keys or keys:
+        fetched = cache.get_many([*missing_keys, *keys])
+        local_table_cache.set_many(
+            {k: fetched[k] for k in missing_keys if k in fetched},
+            fetched_at, invalidations)
+        data.update(fetched)
+    return data
+
+
+def _get_local_result(cache, cache_key, table_cache_keys):
+    entry = local_result_cache.get(cache_key)
+    if entry is None:
+        return False, None
+    stamp, result, _, _, validated_at, expires_at = entry
+    is_atomic = isinstance(_get_result_cache(cache), AtomicCache)
+    now = time()
+    if expires_at is not None and now >= expires_at:
+        local_result_cache.delete(cache_key)
+        return False, None
+    # Inside a transaction, local invalidations only exist in `AtomicCache`,
+    # so the entry must always be validated against it.
+    if not is_atomic and (now - validated_at
+                          < cachalot_settings.CACHALOT_LOCAL_CACHE_STALENESS):
+        return True, result
     try:
-        data = cache.get_many(table_cache_keys + [cache_key])
+        data = _get_many(cache, table_cache_keys)
     except (KeyError, ModuleNotFoundError):
         data = None
-
-    new_table_cache_keys = set(table_cache_keys)
-    if data:
-        new_table_cache_keys.difference_update(data)
-
-        if not new_table_cache_keys:
-            try:
-                timestamp, result = data.pop(cache_key)
-                if timestamp >= max(data.values()):
-                    return result
-            except (KeyError, TypeError, ValueError):
-                # In case `cache_key` is not in `data` or contains bad data,
-                # we simply run the query and cache again the results.
-                pass
-
+    if data and len(data) == len(table_cache_keys):
+        try:
+            if _is_fresh(stamp, data, table_cache_keys):
+                if not is_atomic:
+                    entry[4] = now
+                return True, result
+        except (KeyError, TypeError):
+            pass
+    local_result_cache.delete(cache_key)
+    return False, None
+
+
+def _get_local_expiry(stamp, timeout):
+    if timeout is None:
+        return None
+    # Expires at the same time as the shared cache entry.  Versions
+    # do not tell when it was cached, so the entry is assumed to be new.
+    return (time() if stamp.__class__ is tuple else stamp) + timeout
+
+
+def _is_admitted(db_alias, cache_key, table_cache_keys):
+    min_misses = max([
+        cachalot_settings.CACHALOT_ADMISSION_MIN_MISSES,
+        *_get_table_setting_values('CACHALOT_TABLE_ADMISSION_MIN_MISSES',
+                                   db_alias, table_cache_keys)])
+    return min_misses <= 1 or miss_sketch.increment(cache_key) >= min_misses
+
+
+def _load_result(cache, cache_key, result):
+    if result.__class__ is ChunkedResult:
+        result = join_result(cache, cache_key, result)
+    elif result.__class__ is PickledResult:
+        result = result.load()
+    return cachalot_settings.CACHALOT_RESULT_SERIALIZER.loads(result)
+
+
+def _get_revalidation_lock_key(cache, db_alias, cache_key, timestamp,
+                               table_timestamps):
+    """
+    Decides what to do with a stale result, if all the tables that made it
+    stale are in ``CACHALOT_STALE_WHILE_REVALIDATE`` and were invalidated
+    during their grace period.
+
+    Returns ``None`` if the stale result can be returned because another
+    process is already recomputing it.  Otherwise, the result must be
+    recomputed and the returned lock key deleted afterwards, or ``False``
+    is returned if there is no lock to delete.
+    """
+    # Inside a transaction, previous writes must always be visible.
+    # Versions do not tell when tables were invalidated.
+    if isinstance(_get_result_cache(cache), AtomicCache) \
+            or timestamp.__class__ is tuple:
+        return False
+    grace_periods = _get_table_cache_key_setting(
+        'CACHALOT_STALE_WHILE_REVALIDATE', db_alias)
+    if not grace_periods:
+        return False
+    now = time()
+    lock_timeout = 0
+    for table_cache_key, invalidation in table_timestamps.items():
+        if invalidation > timestamp:
+            grace_period = grace_periods.get(table_cache_key)
+            if grace_period is None or now - invalidation > grace_period:
+                return False
+            lock_timeout = max(lock_timeout, grace_period)
+    lock_key = '%s:revalidation' % cache_key
+    # Only the first process adding the lock recomputes the result.
+    if cache.add(lock_key, now, lock_timeout):
+        return lock_key
+    return None
+
+
+def _execute_query_and_cache(execute_query_func, cache, cache_key,
+                             table_cache_keys, table_values, timeout,
+                             local_cache_key):
     result = execute_query_func()
 
     if result.__class__ == types.GeneratorType and not cachalot_settings.CACHALOT_CACHE_ITERATORS:
@@ -70,19 +212,233 @@ def _get_result_or_execute_query(execute_query_func, cache,
     if result.__class__ not in ITERABLES and isinstance(result, Iterable):
         result = list(result)
 
-    now = time()
-    to_be_set = {k: now for k in new_table_cache_keys}
-    to_be_set[cache_key] = (now, result)
-    cache.set_many(to_be_set, cachalot_settings.CACHALOT_TIMEOUT)
+    new_table_cache_keys = [k for k in table_cache_keys
+                            if k not in table_values]
+    if _uses_versions(_get_table_cache_alias()):
+        # Versions are read before executing the query, so that the result
+        # is stale if a table was invalidated in the meantime.
+        if new_table_cache_keys:
+            versions = _add_table_versions(cache, new_table_cache_keys,
+                                           timeout)
+            if versions is None:
+                return result
+            table_values = {**table_values, **versions}
+        stamp = _get_versions(table_values, table_cache_keys)
+        to_be_set = {}
+    else:
+        stamp = time()
+        to_be_set = dict.fromkeys(new_table_cache_keys, stamp)
+    stored_result = cachalot_settings.CACHALOT_RESULT_SERIALIZER.dumps(result)
+    chunk_size = cachalot_settings.CACHALOT_RESULT_CHUNK_SIZE
+    max_size = cachalot_settings.CACHALOT_MAX_RESULT_SIZE
+    if chunk_size is not None or max_size is not None:
+        values = split_result(cache_key, stored_result, chunk_size, max_size)
+        if values is None:
+            return result
+        stored_result = values.pop(cache_key)
+        to_be_set.update(values)
+    to_be_set[cache_key] = (stamp, stored_result)
+    cache.set_many(to_be_set, timeout)
+    if local_cache_key is not None:
+        local_result_cache.set(local_cache_key, table_cache_keys, stamp,
+                               result, _get_local_expiry(stamp, timeout))
 
     return result
 
 
+def _wait_for_other_process(cache, cache_key, table_cache_keys, lease_key):
+    """
+    Polls the cache until another process caches a fresh result,
+    or until it releases its lease.
+    """
+    deadline = time() + cachalot_settings.CACHALOT_SINGLE_FLIGHT_TIMEOUT
+    delay = 0.005
+    while time() < deadline:
+        sleep(delay)
+        delay = min(delay * 2, 0.1)
+        data = cache.get_many(table_cache_keys + [cache_key, lease_key])
+        lease = data.pop(lease_key, None)
+        try:
+            stamp, result = data.pop(cache_key)
+            if len(data) == len(table_cache_keys) \
+                    and _is_fresh(stamp, data, table_cache_keys):
+                return True, _load_result(cache, cache_key, result)
+        except (KeyError, TypeError, ValueError):
+            pass
+        if lease is None:
+            break
+    return False, None
+
+
+def _execute_query_in_flight(execute_query_func, cache, cache_key,
+                             table_cache_keys, table_values, timeout,
+                             local_cache_key):
+    """
+    Executes and caches the query only once for all the threads
+    and processes missing the same query cache key at the same time.
+    """
+    flight, is_leader = flights.join(cache_key, table_values)
+    if not is_leader:
+        if flight.can_share_with(table_values):
+            found, result = flight.wait(
+                cachalot_settings.CACHALOT_SINGLE_FLIGHT_TIMEOUT)
+            if found:
+                return result
+        return _execute_query_and_cache(
+            execute_query_func, cache, cache_key, table_cache_keys,
+            table_values, timeout, local_cache_key)
+
+    try:
+        lease_key = '%s:flight' % cache_key
+        if cache.add(lease_key, time(),
+                     cachalot_settings.CACHALOT_SINGLE_FLIGHT_TIMEOUT):
+            try:
+                result = _execute_query_and_cache(
+                    execute_query_func, cache, cache_key, table_cache_keys,
+                    table_values, timeout, local_cache_key)
+            finally:
+                cache.delete(lease_key)
+        else:
+            found, result = _wait_for_other_process(
+                cache, cache_key, table_cache_keys, lease_key)
+            if not found:
+                result = _execute_query_and_cache(
+                    execute_query_func, cache, cache_key, table_cache_keys,
+                    table_values, timeout, local_cache_key)
+        if result.__class__ is not types.GeneratorType:
+            flight.result = result
+            flight.has_result = True
+        return result
+    finally:
+        flights.land(cache_key, flight)
+
+
+def _get_table_generation(cache, table_cache_keys, timeout):
+    """
+    Returns the invalidation timestamps or versions of the tables, creating
+    those that are missing.  Returns ``None`` if another process created
+    one of them at the same time.
+    """
+    table_values = _get_many(cache, table_cache_keys)
+    missing_keys = [k for k in table_cache_keys if k not in table_values]
+    if not missing_keys:
+        return table_values
+    if _uses_versions(_get_table_cache_alias()):
+        versions = _add_table_versions(cache, missing_keys, timeout)
+        if versions is None:
+            return None
+    else:
+        versions = dict.fromkeys(missing_keys, time())
+        cache.set_many(versions, timeout)
+    table_values.update(versions)
+    return table_values
+
+
+def _get_result_or_execute_query(execute_query_func, cache, db_alias,
+                                 cache_key, table_cache_keys, timeout):
+    query_cache_key = cache_key
+    local_cache_key = None
+    if cachalot_settings.CACHALOT_LOCAL_CACHE_MAX_SIZE > 0 \
+            or cachalot_settings.CACHALOT_LOCAL_TABLE_CACHE_STALENESS > 0:
+        invalidation_bus.listen()
+    if cachalot_settings.CACHALOT_LOCAL_CACHE_MAX_SIZE > 0:
+        found, result = _get_local_result(cache, cache_key, table_cache_keys)
+        if found:
+            return result
+        # Results from a transaction may be rolled back,
+        # so they are never shared with other threads.
+        if not isinstance(_get_result_cache(cache), AtomicCache):
+            local_cache_key = cache_key
+
+    try:
+        if cachalot_settings.CACHALOT_GENERATIONAL_KEYS:
+            # Results computed before the last invalidation of one
+            # of their tables have another key, so they are never fetched.
+            table_values = _get_table_generation(cache, table_cache_keys,
+                                                 timeout)
+            if table_values is None:
+                return execute_query_func()
+            cache_key = _get_generational_cache_key(
+                cache_key, table_values, table_cache_keys)
+            data = {**table_values, **cache.get_many([cache_key])}
+        elif _fetches_fresh(cache):
+            # Redis checks the freshness and only returns fresh results.
+            data = cache.get_fresh_many(cache_key, table_cache_keys)
+        else:
+            data = _get_many(cache, table_cache_keys, [cache_key])
+    except (KeyError, ModuleNotFoundError):
+        data = {}
+
+    lock_key = False
+    cached = data.pop(cache_key, None)
+    if cached is not None and len(data) == len(table_cache_keys):
+        try:
+            stamp, result = cached
+            if _is_fresh(stamp, data, table_cache_keys):
+                result = _load_result(cache, cache_key, result)
+                if local_cache_key is not None:
+                    local_result_cache.set(local_cache_key, table_cache_keys,
+                                           stamp, result,
+                                           _get_local_expiry(stamp, timeout))
+                return result
+            lock_key = _get_revalidation_lock_key(cache, db_alias,
+                                                  cache_key, stamp, data)
+            if lock_key is None:
+                if result is None:
+                    stamp, result = cache.get(cache_key)
+                return _load_result(cache, cache_key, result)
+        except (KeyError, TypeError, ValueError):
+            # In case `cache_key` contains bad data,
+            # we simply run the query and cache again the results.
+            pass
+
+    # The query needs to be executed, which can only be done in a thread.
+    if _get_result_cache(cache).__class__ is PrefetchedCache:
+        raise CacheMiss
+
+    # A stale result was already admitted, and its lock must be deleted.
+    if not lock_key \
+            and not _is_admitted(db_alias, query_cache_key, table_cache_keys):
+        return execute_query_func()
+
+    # Outside transactions, concurrent misses can wait for a single query.
+    if cachalot_settings.CACHALOT_SINGLE_FLIGHT and not lock_key \
+            and not isinstance(_get_result_cache(cache), AtomicCache):
+        # Leases of other processes must be polled on the real cache,
+        # where the result will then be read.
+        cache = _without_memo(cache, cache_key)
+        return _execute_query_in_flight(
+            execute_query_func, cache, cache_key, table_cache_keys,
+            data, timeout, local_cache_key)
+
+    try:
+        return _execute_query_and_cache(
+            execute_query_func, cache, cache_key, table_cache_keys,
+            data, timeout, local_cache_key)
+    finally:
+        if lock_key:
+            cache.delete(lock_key)
+
+
+def _replay_as_sql(as_sql, sql_and_params):
+    def inner(*args, **kwargs):
+        if args or kwargs:
+            return as_sql(*args, **kwargs)
+        return sql_and_params
+    return inner
+
+
 def _patch_compiler(original):
     @wraps(original)
     @_unset_raw_connection
     def inner(compiler, *args, **kwargs):
-        execute_query_func = lambda: original(compiler, *args, **kwargs)
+        def execute_query_func():
+            # Queries can only be executed in a thread, never in the event
+            # loop, where only cached results are read.
+            if async_cache_reads.get() is not None:
+                raise CacheMiss
+            return original(compiler, *args, **kwargs)
+
         # Checks if utils/cachalot_disabled
         if not getattr(LOCAL_STORAGE, "cachalot_enabled", True):
             return execute_query_func()
@@ -91,17 +447,58 @@ def _patch_compiler(original):
         if db_alias not in cachalot_settings.CACHALOT_DATABASES \
                 or isinstance(compiler, WRITE_COMPILERS):
             return execute_query_func()
+        # Without `CACHALOT_CACHE`, results are only cached in transactions.
+        if cachalot_settings.CACHALOT_CACHE is None \
+                and not cachalot_caches.atomic_caches[db_alias]:
+            return execute_query_func()
 
         try:
-            cache_key = cachalot_settings.CACHALOT_QUERY_KEYGEN(compiler)
-            table_cache_keys = _get_table_cache_keys(compiler)
-        except (EmptyResultSet, UncachableQuery):
-            return execute_query_func()
+            sql_and_params = compiler.as_sql()
+        except EmptyResultSet:
+            # Django returns an empty result without executing any query.
+            return original(compiler, *args, **kwargs)
 
-        return _get_result_or_execute_query(
-            execute_query_func,
-            cachalot_caches.get_cache(db_alias=db_alias),
-            cache_key, table_cache_keys)
+        # The query is compiled only once, key generation, table lookup
+        # and the real execution all reuse this SQL.
+        as_sql = compiler.__dict__.get('as_sql')
+        compiler.as_sql = _replay_as_sql(compiler.as_sql, sql_and_params)
+        try:
+            try:
+                cache_key = cachalot_settings.CACHALOT_QUERY_KEYGEN(compiler)
+                table_cache_keys = _get_table_cache_keys(compiler)
+            except (EmptyResultSet, UncachableQuery):
+                return execute_query_func()
+
+            reads = async_cache_reads.get()
+            # The event loop reads for the thread calling it.
+            batch = (cachalot_caches.batch if reads is None
+                     else current_batch.get())
+            if batch is not None:
+                if reads is None:
+                    cachalot_caches.check_batch()
+                # The invalidations of these tables were not sent yet.
+                if not batch.table_cache_keys.isdisjoint(table_cache_keys):
+                    return execute_query_func()
+
+            cache = cachalot_caches.get_cache(db_alias=db_alias)
+            table_cache_alias = _get_table_cache_alias()
+            table_cache = (
+                cache if table_cache_alias == cachalot_settings.CACHALOT_CACHE
+                else cachalot_caches.get_cache(table_cache_alias, db_alias))
+            if reads is not None:
+                cache = reads.wrap(cache)
+                table_cache = reads.wrap(table_cache)
+            if table_cache is not cache:
+                cache = SplitCache(table_cache, cache, table_cache_keys)
+            return _get_result_or_execute_query(
+                execute_query_func, cache, db_alias,
+                cache_key, table_cache_keys,
+                _get_timeout(db_alias, table_cache_keys, compiler.query))
+        finally:
+            if as_sql is None:
+                del compiler.as_sql
+            else:
+                compiler.as_sql = as_sql
 
     return inner
 
@@ -113,16 +510,45 @@ def _patch_write_compiler(original):
         db_alias = write_compiler.using
         table = write_compiler.query.get_meta().db_table
         if is_cachable(table):
-            invalidate(table, db_alias=db_alias,
-                       cache_alias=cachalot_settings.CACHALOT_CACHE)
+            _invalidate_cachalot_cache(table, db_alias=db_alias)
         return original(write_compiler, *args, **kwargs)
 
     return inner
 
 
+def _patch_async_read(original, sync_method_name):
+    @wraps(original)
+    async def inner(queryset, *args, **kwargs):
+        return await call_with_async_cache(
+            getattr(queryset, sync_method_name), *args, **kwargs)
+
+    return inner
+
+
+def _patch_async_iteration(original):
+    @wraps(original)
+    def inner(queryset):
+        async def generator():
+            await call_with_async_cache(queryset._fetch_all)
+            for item in queryset._result_cache:
+                yield item
+
+        return generator()
+
+    return inner
+
+
 def _patch_orm():
     if cachalot_settings.CACHALOT_ENABLED:
         SQLCompiler.execute_sql = _patch_compiler(SQLCompiler.execute_sql)
+        # Asynchronous queryset methods were added in Django 4.1.
+        if cachalot_settings.CACHALOT_ASYNC_CACHE \
+                and hasattr(QuerySet, '__aiter__'):
+            for method_name in ASYNC_READ_METHODS:
+                if hasattr(QuerySet, method_name):
+                    setattr(QuerySet, method_name, _patch_async_read(
+                        getattr(QuerySet, method_name), method_name[1:]))
+            QuerySet.__aiter__ = _patch_async_iteration(QuerySet.__aiter__)
     for compiler in WRITE_COMPILERS:
         compiler.execute_sql = _patch_write_compiler(compiler.execute_sql)
 
@@ -130,6 +556,12 @@ def _patch_orm():
 def _unpatch_orm():
     if hasattr(SQLCompiler.execute_sql, '__wrapped__'):
         SQLCompiler.execute_sql = SQLCompiler.execute_sql.__wrapped__
+    if hasattr(getattr(QuerySet, '__aiter__', None), '__wrapped__'):
+        for method_name in ASYNC_READ_METHODS:
+            if hasattr(QuerySet, method_name):
+                setattr(QuerySet, method_name,
+                        getattr(QuerySet, method_name).__wrapped__)
+        QuerySet.__aiter__ = QuerySet.__aiter__.__wrapped__
     for compiler in WRITE_COMPILERS:
         compiler.execute_sql = compiler.execute_sql.__wrapped__
 
@@ -150,9 +582,8 @@ def _patch_cursor():
                         tables = filter_cachable(
                             _get_tables_from_sql(connection, sql))
                         if tables:
-                            invalidate(
-                                *tables, db_alias=connection.alias,
-                                cache_alias=cachalot_settings.CACHALOT_CACHE)
+                            _invalidate_cachalot_cache(
+                                *tables, db_alias=connection.alias)
 
         return inner
 
@@ -198,12 +629,17 @@ def _unpatch_atomic():
 
 
 def _invalidate_on_migration(sender, **kwargs):
-    invalidate(*sender.get_models(), db_alias=kwargs['using'],
-               cache_alias=cachalot_settings.CACHALOT_CACHE)
+    _clear_memos()
+    _invalidate_cachalot_cache(*sender.get_models(), db_alias=kwargs['using'])
 
 
 def patch():
     post_migrate.connect(_invalidate_on_migration)
+    local_result_cache.clear()
+    local_table_cache.clear()
+    miss_sketch.clear()
+    flights.clear()
+    _clear_memos()
 
     _patch_cursor()
     _patch_atomic()
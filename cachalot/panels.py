@@ -9,6 +9,7 @@ from django.utils.timesince import timesince
 
 from .cache import cachalot_caches
 from .settings import cachalot_settings
+from .utils import _get_table_cache_alias, _uses_versions
 
 
 class CachalotPanel(Panel):
@@ -43,8 +44,12 @@ class CachalotPanel(Panel):
     def collect_invalidations(self):
         models = apps.get_models()
         data = defaultdict(list)
-        cache = cachalot_caches.get_cache()
-        for db_alias in settings.DATABASES:
+        table_cache_alias = _get_table_cache_alias()
+        cache = cachalot_caches.get_cache(table_cache_alias)
+        # Versioned caches do not store when tables were invalidated.
+        db_aliases = (() if _uses_versions(table_cache_alias)
+                      else settings.DATABASES)
+        for db_alias in db_aliases:
             get_table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN
             model_cache_keys = {
                 get_table_cache_key(db_alias, model._meta.db_table): model
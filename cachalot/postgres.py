@@ -0,0 +1,171 @@
+"""
+Invalidation of the tables modified outside Django, notified by PostgreSQL
+triggers through ``NOTIFY``.
+"""
+
+import inspect
+import logging
+from select import select
+from threading import Event, Thread
+from time import monotonic
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .api import _invalidate_cachalot_cache
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'cachalot'
+
+CREATE_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION cachalot_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify(TG_ARGV[0], TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+DROP_TRIGGER_SQL = 'DROP TRIGGER IF EXISTS cachalot_notify ON %s'
+# Notifications are sent on commit, and PostgreSQL sends identical
+# notifications of the same transaction only once.
+CREATE_TRIGGER_SQL = """
+CREATE TRIGGER cachalot_notify
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %s
+FOR EACH STATEMENT EXECUTE PROCEDURE cachalot_notify(%s)
+"""
+
+
+def _quote_literal(value):
+    return "'%s'" % value.replace("'", "''")
+
+
+def install_triggers(tables, db_alias=DEFAULT_DB_ALIAS, channel=CHANNEL):
+    """
+    Makes PostgreSQL send the name of ``tables`` on ``channel``
+    after each transaction modifying them.
+    """
+    connection = connections[db_alias]
+    with transaction.atomic(using=db_alias), connection.cursor() as cursor:
+        cursor.execute(CREATE_FUNCTION_SQL)
+        for table in tables:
+            table = connection.ops.quote_name(table)
+            cursor.execute(DROP_TRIGGER_SQL % table)
+            cursor.execute(CREATE_TRIGGER_SQL
+                           % (table, _quote_literal(channel)))
+
+
+def uninstall_triggers(tables, db_alias=DEFAULT_DB_ALIAS):
+    connection = connections[db_alias]
+    with transaction.atomic(using=db_alias), connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute(DROP_TRIGGER_SQL % connection.ops.quote_name(table))
+
+
+class PostgresListener:
+    """
+    Invalidates the tables notified by the triggers of
+    :func:`install_triggers`, waiting up to ``max_delay`` seconds
+    to invalidate the tables notified together at once.
+    """
+
+    poll_interval = 0.5
+    # Seconds to wait before reconnecting, doubled after each failed attempt.
+    min_retry_delay = 1
+    max_retry_delay = 60
+
+    def __init__(self, db_alias=DEFAULT_DB_ALIAS, channel=CHANNEL,
+                 max_delay=0.1):
+        self.db_alias = db_alias
+        self.channel = channel
+        self.max_delay = max_delay
+        self._stop = Event()
+        self._listening = False
+
+    def check_driver(self):
+        """
+        Raises ``ImproperlyConfigured`` if the database driver cannot
+        wait for notifications.
+        """
+        database = connections[self.db_alias].Database
+        # psycopg2 connections are polled.
+        if database.__name__ != 'psycopg':
+            return
+        parameters = inspect.signature(database.Connection.notifies).parameters
+        if 'timeout' not in parameters or 'stop_after' not in parameters:
+            raise ImproperlyConfigured(
+                'PostgresListener requires psycopg2 or psycopg 3.2+.')
+
+    def run(self):
+        """
+        Listens until :meth:`stop` is called, reconnecting after errors.
+        """
+        self.check_driver()
+        listened_once = False
+        retry_delay = self.min_retry_delay
+        while not self._stop.is_set():
+            self._listening = False
+            try:
+                # Changes made while disconnected were not notified.
+                self.listen(invalidate_all=listened_once)
+            except Exception:
+                if self._listening:
+                    retry_delay = self.min_retry_delay
+                logger.exception(
+                    'Error while listening to PostgreSQL notifications '
+                    'on %r, retrying in %s s.', self.db_alias, retry_delay)
+                self._stop.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, self.max_retry_delay)
+            listened_once = listened_once or self._listening
+
+    def start(self):
+        """
+        Listens in a thread of the current process.
+        """
+        self.check_driver()
+        Thread(target=self.run, name='cachalot-postgres-listener',
+               daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def listen(self, invalidate_all=False):
+        connection = connections.create_connection(self.db_alias)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'LISTEN %s' % connection.ops.quote_name(self.channel))
+            self._listening = True
+            if invalidate_all:
+                _invalidate_cachalot_cache(db_alias=self.db_alias)
+            tables = set()
+            deadline = None
+            while not self._stop.is_set():
+                timeout = (self.poll_interval if deadline is None
+                           else max(0, deadline - monotonic()))
+                notified = self.receive(connection.connection, timeout)
+                if notified and deadline is None:
+                    deadline = monotonic() + self.max_delay
+                tables.update(notified)
+                if deadline is not None and monotonic() >= deadline:
+                    _invalidate_cachalot_cache(*tables,
+                                               db_alias=self.db_alias)
+                    tables.clear()
+                    deadline = None
+        finally:
+            connection.close()
+
+    def receive(self, raw_connection, timeout):
+        # psycopg2
+        if hasattr(raw_connection, 'poll'):
+            if select([raw_connection], [], [], timeout) == ([], [], []):
+                return []
+            raw_connection.poll()
+            payloads = [notify.payload for notify in raw_connection.notifies]
+            del raw_connection.notifies[:]
+            return payloads
+        # psycopg >= 3.2
+        return [notify.payload for notify in raw_connection.notifies(
+            timeout=timeout, stop_after=1)]
@@ -0,0 +1,174 @@
+import zlib
+from array import array
+from itertools import chain, islice
+from pickle import dumps, loads, HIGHEST_PROTOCOL, UnpicklingError
+from uuid import uuid4
+
+
+class ResultSerializer:
+    """
+    Converts query results before they are stored in ``CACHALOT_CACHE``
+    and converts them back when they are read.
+
+    This base serializer keeps results unchanged, leaving their serialization
+    to the cache backend.  Subclasses must return an object that the cache
+    backend can store, and ``loads`` must raise ``ValueError``
+    on data it cannot decode.
+    """
+
+    def dumps(self, result):
+        return result
+
+    def loads(self, data):
+        return data
+
+
+class CompactResultSerializer(ResultSerializer):
+    """
+    Stores rows of the same width column by column.
+
+    Integer and float columns are packed as C arrays, other columns
+    are pickled as lists, which avoids pickling one tuple per row.
+    Payloads larger than ``compress_threshold`` bytes are compressed
+    with zlib.  Other results are stored unchanged.
+    """
+
+    compress_threshold = 16 * 1024
+    compress_level = 1
+
+    RAW = b'r'
+    COMPRESSED = b'z'
+    ARRAY_TYPECODES = {int: 'q', float: 'd'}
+
+    def _encode_column(self, column):
+        classes = set(map(type, column))
+        if len(classes) == 1:
+            typecode = self.ARRAY_TYPECODES.get(classes.pop())
+            if typecode is not None:
+                try:
+                    return typecode, array(typecode, column).tobytes()
+                except OverflowError:
+                    pass
+        return None, list(column)
+
+    def dumps(self, result):
+        # Results of `SQLCompiler.execute_sql` for multiple rows
+        # are lists of chunks of rows.
+        if result.__class__ is not list or not result \
+                or set(map(type, result)) != {list}:
+            return result
+        rows = list(chain.from_iterable(result))
+        if set(map(type, rows)) != {tuple} or len(set(map(len, rows))) != 1:
+            return result
+        payload = dumps((
+            [len(chunk) for chunk in result],
+            [self._encode_column(column) for column in zip(*rows)],
+        ), HIGHEST_PROTOCOL)
+        if len(payload) > self.compress_threshold:
+            return self.COMPRESSED + zlib.compress(payload,
+                                                   self.compress_level)
+        return self.RAW + payload
+
+    def loads(self, data):
+        if data.__class__ is not bytes:
+            return data
+        try:
+            payload = data[1:]
+            if data[:1] == self.COMPRESSED:
+                payload = zlib.decompress(payload)
+            chunk_sizes, columns = loads(payload)
+            columns = [values if typecode is None
+                       else array(typecode, values).tolist()
+                       for typecode, values in columns]
+        except (zlib.error, UnpicklingError, EOFError, TypeError) as e:
+            raise ValueError(e)
+        rows = zip(*columns)
+        return [list(islice(rows, size)) for size in chunk_sizes]
+
+
+class ChunkedResult:
+    """
+    Stored instead of a result larger than ``CACHALOT_RESULT_CHUNK_SIZE``,
+    whose pickled bytes are split into ``count`` other cache keys.
+
+    ``token`` is unique to each write, so chunks written concurrently
+    for the same query are never mixed.
+    """
+
+    __slots__ = ('token', 'count')
+
+    def __init__(self, token, count):
+        self.token = token
+        self.count = count
+
+    def __getstate__(self):
+        return self.token, self.count
+
+    def __setstate__(self, state):
+        self.token, self.count = state
+
+    def get_chunk_keys(self, cache_key):
+        return ['%s:%s:%s' % (cache_key, self.token, i)
+                for i in range(self.count)]
+
+
+class PickledResult:
+    """
+    Stored instead of a result already pickled by :func:`split_result`
+    to measure its size, so that the cache backend only has to pickle
+    these bytes instead of the whole result again.
+    """
+
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __getstate__(self):
+        return self.payload
+
+    def __setstate__(self, state):
+        self.payload = state
+
+    def load(self):
+        return _loads(self.payload)
+
+
+def _loads(payload):
+    try:
+        return loads(payload)
+    except (UnpicklingError, EOFError) as e:
+        raise ValueError(e)
+
+
+def split_result(cache_key, result, chunk_size, max_size=None):
+    """
+    Returns the cache values to store for ``result``: a
+    :class:`PickledResult`, or a :class:`ChunkedResult` and its chunks
+    if it is larger than ``chunk_size`` bytes once pickled.
+    Returns ``None`` if ``result`` is larger than ``max_size`` bytes.
+    """
+    payload = dumps(result, HIGHEST_PROTOCOL)
+    if max_size is not None and len(payload) > max_size:
+        return None
+    if chunk_size is None or len(payload) <= chunk_size:
+        # Bytes, like those of `CompactResultSerializer`, are cheap to pickle.
+        if result.__class__ is bytes:
+            return {cache_key: result}
+        return {cache_key: PickledResult(payload)}
+    chunked_result = ChunkedResult(uuid4().hex[:12],
+                                   -(-len(payload) // chunk_size))
+    values = {cache_key: chunked_result}
+    for i, chunk_key in enumerate(chunked_result.get_chunk_keys(cache_key)):
+        values[chunk_key] = payload[i * chunk_size:(i + 1) * chunk_size]
+    return values
+
+
+def join_result(cache, cache_key, chunked_result):
+    """
+    Fetches and reassembles the chunks of ``chunked_result``.
+    Raises ``KeyError`` if a chunk is missing, for example if it expired.
+    """
+    chunk_keys = chunked_result.get_chunk_keys(cache_key)
+    chunks = cache.get_many(chunk_keys)
+    return _loads(b''.join([chunks[k] for k in chunk_keys]))
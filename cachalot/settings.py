@@ -32,6 +32,8 @@ SUPPORTED_CACHE_BACKENDS = {
     'django.core.cache.backends.filebased.FileBasedCache',
     'django.core.cache.backends.redis.RedisCache',
     'django_redis.cache.RedisCache',
+    'cachalot.backends.CachalotRedisCache',
+    'cachalot.backends.CachalotDjangoRedisCache',
     'django.core.cache.backends.memcached.MemcachedCache',
     'django.core.cache.backends.memcached.PyLibMCCache',
     'django.core.cache.backends.memcached.PyMemcacheCache',
@@ -47,8 +49,12 @@ class Settings(object):
 
     CACHALOT_ENABLED = True
     CACHALOT_CACHE = 'default'
+    CACHALOT_TABLE_CACHE = None
     CACHALOT_DATABASES = 'supported_only'
     CACHALOT_TIMEOUT = None
+    CACHALOT_VERSIONED_CACHES = ()
+    CACHALOT_GENERATIONAL_KEYS = False
+    CACHALOT_TABLE_TIMEOUTS = {}
     CACHALOT_CACHE_RANDOM = False
     CACHALOT_CACHE_ITERATORS = True
     CACHALOT_INVALIDATE_RAW = True
@@ -59,7 +65,22 @@ class Settings(object):
     CACHALOT_ADDITIONAL_TABLES = ()
     CACHALOT_QUERY_KEYGEN = 'cachalot.utils.get_query_cache_key'
     CACHALOT_TABLE_KEYGEN = 'cachalot.utils.get_table_cache_key'
+    CACHALOT_RESULT_SERIALIZER = 'cachalot.serializers.ResultSerializer'
+    CACHALOT_RESULT_CHUNK_SIZE = None
+    CACHALOT_MAX_RESULT_SIZE = None
+    CACHALOT_ADMISSION_MIN_MISSES = 1
+    CACHALOT_TABLE_ADMISSION_MIN_MISSES = {}
+    CACHALOT_STALE_WHILE_REVALIDATE = {}
+    CACHALOT_SINGLE_FLIGHT = False
+    CACHALOT_SINGLE_FLIGHT_TIMEOUT = 5
+    CACHALOT_ASYNC_CACHE = True
     CACHALOT_FINAL_SQL_CHECK = False
+    CACHALOT_SQL_MEMO_SIZE = 1000
+    CACHALOT_LOCAL_CACHE_MAX_SIZE = 0
+    CACHALOT_LOCAL_CACHE_STALENESS = 0
+    CACHALOT_LOCAL_TABLE_CACHE_STALENESS = 0
+    CACHALOT_INVALIDATION_BUS = None
+    CACHALOT_INVALIDATION_BUS_OPTIONS = {}
 
     @classmethod
     def add_converter(cls, setting):
@@ -117,6 +138,31 @@ def convert_tables(value, setting_app_name):
     return frozenset(value)
 
 
+def convert_table_mapping(value):
+    """
+    Converts a mapping whose keys are SQL table names, app labels
+    or model lookups such as ``'auth.User'`` to a mapping of table names.
+    Tables are more specific than models, which are more specific than apps.
+    """
+    app_tables = {}
+    model_tables = {}
+    tables = {}
+    for key, table_value in value.items():
+        if '.' in key:
+            try:
+                model_tables[apps.get_model(key)._meta.db_table] = table_value
+                continue
+            except LookupError:
+                pass
+        elif key in apps.app_configs:
+            app_tables.update(dict.fromkeys(
+                (model._meta.db_table
+                 for model in apps.all_models[key].values()), table_value))
+            continue
+        tables[key] = table_value
+    return {**app_tables, **model_tables, **tables}
+
+
 @Settings.add_converter('CACHALOT_ONLY_CACHABLE_TABLES')
 def convert(value):
     return convert_tables(value, 'CACHALOT_ONLY_CACHABLE_APPS')
@@ -132,6 +178,26 @@ def convert(value):
     return list(value)
 
 
+@Settings.add_converter('CACHALOT_VERSIONED_CACHES')
+def convert(value):
+    return frozenset(value)
+
+
+@Settings.add_converter('CACHALOT_TABLE_TIMEOUTS')
+def convert(value):
+    return convert_table_mapping(value)
+
+
+@Settings.add_converter('CACHALOT_TABLE_ADMISSION_MIN_MISSES')
+def convert(value):
+    return convert_table_mapping(value)
+
+
+@Settings.add_converter('CACHALOT_STALE_WHILE_REVALIDATE')
+def convert(value):
+    return convert_table_mapping(value)
+
+
 @Settings.add_converter('CACHALOT_QUERY_KEYGEN')
 def convert(value):
     return import_string(value)
@@ -142,4 +208,16 @@ def convert(value):
     return import_string(value)
 
 
+@Settings.add_converter('CACHALOT_INVALIDATION_BUS')
+def convert(value):
+    if value is None:
+        return value
+    return import_string(value)
+
+
+@Settings.add_converter('CACHALOT_RESULT_SERIALIZER')
+def convert(value):
+    return import_string(value)()
+
+
 cachalot_settings = Settings()
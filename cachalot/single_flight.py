@@ -0,0 +1,63 @@
+from threading import Event, Lock
+
+
+class Flight:
+    """
+    Execution of a SQL query shared by the threads of a process
+    that missed the same query cache key at the same time.
+    """
+
+    __slots__ = ('table_values', 'landed', 'result', 'has_result')
+
+    def __init__(self, table_values=None):
+        self.table_values = table_values
+        self.landed = Event()
+        self.result = None
+        self.has_result = False
+
+    def can_share_with(self, table_values):
+        # The leader must have read the same table invalidations
+        # as the follower, otherwise its query could miss writes
+        # made by the follower.
+        return self.table_values is not None \
+            and self.table_values == table_values
+
+    def wait(self, timeout):
+        """Waits for the result of the leader and returns it if it has one."""
+        if self.landed.wait(timeout) and self.has_result:
+            return True, self.result
+        return False, None
+
+
+class Flights:
+    def __init__(self):
+        self._lock = Lock()
+        self._flights = {}
+
+    def join(self, cache_key, table_values=None):
+        """
+        Returns the flight of ``cache_key`` and whether the current thread
+        leads it, meaning it must execute the query then call :meth:`land`.
+
+        ``table_values`` are the table invalidation timestamps or versions
+        read before executing the query.
+        """
+        with self._lock:
+            flight = self._flights.get(cache_key)
+            if flight is None:
+                flight = self._flights[cache_key] = Flight(table_values)
+                return flight, True
+            return flight, False
+
+    def land(self, cache_key, flight):
+        with self._lock:
+            if self._flights.get(cache_key) is flight:
+                del self._flights[cache_key]
+        flight.landed.set()
+
+    def clear(self):
+        with self._lock:
+            self._flights.clear()
+
+
+flights = Flights()
@@ -5,13 +5,25 @@ from ..settings import cachalot_settings
 from .read import ReadTestCase, ParameterTypeTestCase
 from .write import WriteTestCase, DatabaseCommandTestCase
 from .transaction import AtomicCacheTestCase, AtomicTestCase
-from .thread_safety import ThreadSafetyTestCase
+from .thread_safety import ThreadSafetyTestCase, SingleFlightTestCase
 from .multi_db import MultiDatabaseTestCase
 from .settings import SettingsTestCase
 from .api import APITestCase, CommandTestCase
 from .signals import SignalsTestCase
-from .postgres import PostgresReadTestCase
+from .postgres import (
+    PostgresReadTestCase, PostgresNotifyTestCase, PostgresListenerTestCase)
 from .debug_toolbar import DebugToolbarTestCase
+from .async_cache import AsyncCacheTestCase
+from .versions import VersionedCacheTestCase
+from .backends import RedisSerializerTestCase, CachalotRedisCacheTestCase
+from .local_cache import (
+    LocalCacheTestCase, LocalResultCacheTestCase, LocalTableCacheTestCase,
+    LocalTableCacheUnitTestCase)
+from .bus import InvalidationBusTestCase
+from .table_matcher import TableMatcherTestCase, TablesFromSQLTestCase
+from .serializers import (
+    CompactResultSerializerTestCase, CompactResultSerializerCacheTestCase,
+    ChunkedResultTestCase)
 
 
 @receiver(setting_changed)
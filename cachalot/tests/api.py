@@ -1,6 +1,7 @@
 import os
 from time import time, sleep
 from unittest import skipIf
+from unittest.mock import patch
 
 from django.conf import settings
 from django.contrib.auth.models import Permission, User
@@ -12,6 +13,11 @@ from django.test import TransactionTestCase
 from jinja2.exceptions import TemplateSyntaxError
 
 from ..api import *
+from ..cache import cachalot_caches
+from ..memo import memo_caches
+from ..middleware import CacheReadsMemoMiddleware, InvalidationBatchMiddleware
+from ..settings import cachalot_settings
+from ..signals import post_invalidation
 from .models import Test
 from .test_utils import TestUtilsMixin
 
@@ -266,6 +272,138 @@ class APITestCase(TestUtilsMixin, TransactionTestCase):
                                    'cache': self.cache_alias2})
         self.assertEqual(content, 'better!')
 
+    def test_set_cache_timeout(self):
+        qs = set_cache_timeout(Test.objects.all(), 0)
+        self.assertIsNot(qs.query, Test.objects.all().query)
+        with self.assertNumQueries(1):
+            self.assertListEqual(list(qs.all()), [self.t1])
+        sleep(0.05)
+        with self.assertNumQueries(1):
+            self.assertListEqual(list(qs.filter(name='test1')), [self.t1])
+        with self.assertNumQueries(1):
+            self.assertListEqual(list(qs.filter(name='test1')), [self.t1])
+
+        with self.settings(CACHALOT_TIMEOUT=0):
+            self.assert_query_cached(set_cache_timeout(Test.objects.all(),
+                                                       None))
+
+    def test_batch_invalidations(self):
+        table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN(
+            DEFAULT_DB_ALIAS, Test._meta.db_table)
+        cache = caches[cachalot_settings.CACHALOT_CACHE]
+        invalidations = []
+
+        def receiver(sender, **kwargs):
+            invalidations.append(sender)
+
+        qs = Test.objects.all()
+        self.assert_query_cached(qs, [self.t1])
+        before = cache.get(table_cache_key)
+        post_invalidation.connect(receiver)
+        try:
+            with batch_invalidations():
+                t2 = Test.objects.create(name='test2')
+                t3 = Test.objects.create(name='test3')
+                # Writes are immediately visible to the current thread,
+                # which does not read the invalidated tables from the cache…
+                for _ in range(2):
+                    with self.assertNumQueries(1):
+                        self.assertListEqual(list(qs.all()),
+                                             [self.t1, t2, t3])
+                # … but still reads the other tables from it.
+                self.assert_query_cached(User.objects.all())
+                self.assertEqual(cache.get(table_cache_key), before)
+                self.assertListEqual(invalidations, [])
+        finally:
+            post_invalidation.disconnect(receiver)
+        self.assertNotEqual(cache.get(table_cache_key), before)
+        self.assertListEqual(invalidations, [Test._meta.db_table])
+        self.assert_query_cached(qs, [self.t1, t2, t3])
+
+    def test_batch_invalidations_limits(self):
+        table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN(
+            DEFAULT_DB_ALIAS, Test._meta.db_table)
+        cache = caches[cachalot_settings.CACHALOT_CACHE]
+        before = cache.get(table_cache_key)
+        with batch_invalidations(max_tables=1):
+            Test.objects.create(name='test2')
+            after = cache.get(table_cache_key)
+            self.assertNotEqual(after, before)
+
+            # Invalidations are not sent during transactions.
+            with transaction.atomic():
+                Test.objects.create(name='test3')
+                self.assertEqual(cache.get(table_cache_key), after)
+            self.assertEqual(cache.get(table_cache_key), after)
+            Test.objects.create(name='test4')
+            self.assertNotEqual(cache.get(table_cache_key), after)
+
+        with batch_invalidations(max_delay=0.05):
+            Test.objects.create(name='test5')
+            after = cache.get(table_cache_key)
+            sleep(0.05)
+            Test.objects.create(name='test6')
+            self.assertNotEqual(cache.get(table_cache_key), after)
+
+            # Limits are also checked before reading.
+            Test.objects.create(name='test7')
+            after = cache.get(table_cache_key)
+            sleep(0.05)
+            list(User.objects.all())
+            self.assertNotEqual(cache.get(table_cache_key), after)
+        self.assert_query_cached(Test.objects.all())
+        self.assertEqual(Test.objects.count(), 7)
+
+    def test_invalidation_batch_middleware(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs, [self.t1])
+
+        def get_response(request):
+            Test.objects.create(name='test2')
+            self.assertTrue(cachalot_caches.batch)
+            return list(qs.all())
+
+        response = InvalidationBatchMiddleware(get_response)(None)
+        self.assertIsNone(cachalot_caches.batch)
+        self.assertEqual(len(response), 2)
+        self.assert_query_cached(qs, response)
+
+    def test_memoize_cache_reads(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs, [self.t1])
+        cache = caches[cachalot_settings.CACHALOT_CACHE]
+        with patch.object(cache, 'get_many',
+                          wraps=cache.get_many) as get_many:
+            with memoize_cache_reads():
+                with self.assertNumQueries(0):
+                    self.assertListEqual(list(qs.all()), [self.t1])
+                reads = get_many.call_count
+                self.assertGreater(reads, 0)
+                with memoize_cache_reads(), self.assertNumQueries(0):
+                    self.assertListEqual(list(qs.all()), [self.t1])
+                    self.assertListEqual(list(qs.all()), [self.t1])
+                self.assertEqual(get_many.call_count, reads)
+
+                # Writes are immediately visible inside the memo.
+                t2 = Test.objects.create(name='test2')
+                self.assert_query_cached(qs, [self.t1, t2])
+            self.assertIsNone(memo_caches.get())
+            self.assert_query_cached(qs, [self.t1, t2], before=0)
+            self.assertGreater(get_many.call_count, reads)
+
+    def test_cache_reads_memo_middleware(self):
+        qs = Test.objects.all()
+
+        def get_response(request):
+            self.assertIsNotNone(memo_caches.get())
+            Test.objects.create(name='test2')
+            return list(qs.all())
+
+        response = CacheReadsMemoMiddleware(get_response)(None)
+        self.assertIsNone(memo_caches.get())
+        self.assertEqual(len(response), 2)
+        self.assert_query_cached(qs, response, before=0)
+
     def test_cachalot_disabled_multiple_queries_ignoring_in_mem_cache(self):
         """
         Test that when queries are given the `cachalot_disabled` context manager,
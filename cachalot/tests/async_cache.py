@@ -0,0 +1,133 @@
+import os
+from threading import current_thread
+from unittest import skipIf
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django import VERSION as DJANGO_VERSION
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.utils import CursorWrapper
+from django.test.utils import override_settings
+
+from ..api import batch_invalidations
+from ..cache import cachalot_caches
+from ..memo import memo_caches
+from ..middleware import CacheReadsMemoMiddleware
+from .models import Test
+from .test_utils import TestUtilsMixin, FilteredTransactionTestCase
+
+
+@skipIf(DJANGO_VERSION < (4, 1), 'Asynchronous queries need Django 4.1+.')
+class AsyncCacheTestCase(TestUtilsMixin, FilteredTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.t1 = Test.objects.create(name='test1')
+        self.t2 = Test.objects.create(name='test2')
+
+    async def assert_async_cached(self, func, *args, **kwargs):
+        with patch('cachalot.async_cache.sync_to_async',
+                   wraps=sync_to_async) as sync_to_async_mock:
+            result1 = await func(*args, **kwargs)
+            self.assertEqual(sync_to_async_mock.call_count, 1)
+            # Cache hits are returned without any thread.
+            result2 = await func(*args, **kwargs)
+            self.assertEqual(sync_to_async_mock.call_count, 1)
+        self.assertEqual(result1, result2)
+        return result2
+
+    async def test_get(self):
+        t = await self.assert_async_cached(Test.objects.aget, name='test1')
+        self.assertEqual(t, self.t1)
+
+    async def test_count(self):
+        count = await self.assert_async_cached(Test.objects.acount)
+        self.assertEqual(count, 2)
+
+    async def test_iteration(self):
+        async def iterate():
+            return [t async for t in Test.objects.order_by('name')]
+
+        data = await self.assert_async_cached(iterate)
+        self.assertListEqual(data, [self.t1, self.t2])
+
+    async def test_prefetch_related(self):
+        async def iterate():
+            return [t async for t in Test.objects.order_by('name')
+                    .prefetch_related('owner')]
+
+        data = await self.assert_async_cached(iterate)
+        self.assertListEqual(data, [self.t1, self.t2])
+
+    async def test_invalidation(self):
+        qs = Test.objects.filter(name='test3')
+        self.assertFalse(await qs.aexists())
+        t3 = await Test.objects.acreate(name='test3')
+        self.assertEqual(await qs.afirst(), t3)
+
+    async def test_cache_reads_memo_middleware(self):
+        async def get_response(request):
+            self.assertIsNotNone(memo_caches.get())
+            await Test.objects.acreate(name='test3')
+            return await self.assert_async_cached(
+                lambda: Test.objects.order_by('name').acount())
+
+        middleware = CacheReadsMemoMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assertEqual(await middleware(None), 3)
+        self.assertIsNone(memo_caches.get())
+
+    def test_atomic(self):
+        self.assertEqual(Test.objects.count(), 2)
+        with transaction.atomic():
+            Test.objects.create(name='test3')
+            # The event loop thread sees the transaction of its caller.
+            self.assertEqual(async_to_sync(Test.objects.acount)(), 3)
+        self.assertEqual(async_to_sync(Test.objects.acount)(), 3)
+
+    def test_atomic_other_thread(self):
+        def count_levels():
+            return len(cachalot_caches.atomic_caches[DEFAULT_DB_ALIAS])
+
+        with transaction.atomic():
+            self.assertEqual(count_levels(), 1)
+            # Other threads never see the atomic caches of this one.
+            self.assertEqual(async_to_sync(sync_to_async(
+                count_levels, thread_sensitive=False))(), 0)
+
+    def test_batch_invalidations(self):
+        self.assertEqual(Test.objects.count(), 2)
+        self.assertEqual(User.objects.count(), 0)
+        with batch_invalidations():
+            Test.objects.create(name='test3')
+            with patch('cachalot.async_cache.sync_to_async',
+                       wraps=sync_to_async) as sync_to_async_mock:
+                # Other tables are still read from the event loop.
+                self.assertEqual(async_to_sync(User.objects.acount)(), 0)
+                sync_to_async_mock.assert_not_called()
+                self.assertEqual(async_to_sync(Test.objects.acount)(), 3)
+                sync_to_async_mock.assert_called_once()
+        self.assertEqual(async_to_sync(Test.objects.acount)(), 3)
+
+    @override_settings(CACHALOT_UNCACHABLE_TABLES=('cachalot_test',))
+    async def test_uncachable(self):
+        execute = CursorWrapper.execute
+        threads = []
+
+        def record_thread(cursor, *args, **kwargs):
+            threads.append(current_thread())
+            return execute(cursor, *args, **kwargs)
+
+        # Even when allowed, queries are never executed in the event loop.
+        with patch.dict(os.environ, DJANGO_ALLOW_ASYNC_UNSAFE='true'), \
+                patch.object(CursorWrapper, 'execute', record_thread):
+            self.assertEqual(await Test.objects.acount(), 2)
+        self.assertTrue(threads)
+        self.assertNotIn(current_thread(), threads)
+
+    @override_settings(CACHALOT_ASYNC_CACHE=False)
+    async def test_disabled(self):
+        with patch('cachalot.async_cache.sync_to_async') as sync_to_async_mock:
+            self.assertEqual(await Test.objects.acount(), 2)
+            self.assertEqual(await Test.objects.acount(), 2)
+        sync_to_async_mock.assert_not_called()
@@ -0,0 +1,119 @@
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+from django.test.utils import override_settings
+
+from ..api import invalidate, memoize_cache_reads
+from ..backends import RedisSerializer
+from ..settings import cachalot_settings
+from ..utils import _get_table_cache_keys
+from .models import Test
+from .test_utils import TestUtilsMixin
+
+
+@skipIf(RedisSerializer is None, 'Django has no Redis cache backend')
+class RedisSerializerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.serializer = RedisSerializer()
+
+    def assert_round_trip(self, value, data=None):
+        dumped = self.serializer.dumps(value)
+        if data is not None:
+            self.assertEqual(dumped, data)
+        self.assertEqual(self.serializer.loads(dumped), value)
+
+    def test_numbers(self):
+        # Integers are stored as is by Redis, and read back as bytes.
+        self.assertEqual(self.serializer.dumps(1), 1)
+        self.assertEqual(self.serializer.loads(b'1'), 1)
+        self.assert_round_trip(1234.5, b'1234.5')
+        self.assert_round_trip(-1e-20, b'-1e-20')
+
+    def test_stamped_results(self):
+        self.assert_round_trip((1234.5, [(1, 'a')]))
+        self.assert_round_trip(((1, 22), b'result'))
+        self.assertTrue(
+            self.serializer.dumps((1234.5, None)).startswith(b'=1234.5\n'))
+        self.assertTrue(
+            self.serializer.dumps(((1, 22), None)).startswith(b'#1,22\n'))
+
+    def test_stale_results(self):
+        self.assertEqual(self.serializer.loads(b'=1234.5'), (1234.5, None))
+        self.assertEqual(self.serializer.loads(b'#1,22'), ((1, 22), None))
+
+    def test_other_values(self):
+        self.assert_round_trip('1234.5')
+        self.assert_round_trip((1, 2))
+        self.assert_round_trip(('stamp', 'result'))
+        self.assert_round_trip(True)
+
+
+@skipIf('cachalot_redis' not in settings.CACHES,
+        'The Redis cache of cachalot is not configured')
+@override_settings(CACHALOT_CACHE='cachalot_redis')
+class CachalotRedisCacheTestCase(TestUtilsMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['cachalot_redis'].clear()
+
+    def get_fresh_result(self, qs):
+        compiler = qs.query.get_compiler(connection.alias)
+        cache_key = cachalot_settings.CACHALOT_QUERY_KEYGEN(compiler)
+        data = caches['cachalot_redis'].get_fresh_many(
+            cache_key, _get_table_cache_keys(compiler))
+        return data.pop(cache_key), data
+
+    def test_fetch_fresh(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        (stamp, result), table_values = self.get_fresh_result(qs)
+        self.assertIsNotNone(result)
+        self.assertGreaterEqual(stamp, max(table_values.values()))
+
+        invalidate(Test)
+        (stamp, result), table_values = self.get_fresh_result(qs)
+        self.assertIsNone(result)
+        self.assertLess(stamp, max(table_values.values()))
+
+        t = Test.objects.create(name='test')
+        self.assert_query_cached(qs, [t])
+
+    def test_memoized_fetch_fresh(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        cache = caches['cachalot_redis']
+        with patch.object(cache, 'get_fresh_many',
+                          wraps=cache.get_fresh_many) as get_fresh_many:
+            with memoize_cache_reads(), self.assertNumQueries(0):
+                self.assertListEqual(list(qs.all()), [])
+                self.assertListEqual(list(qs.all()), [])
+            self.assertEqual(get_fresh_many.call_count, 1)
+
+    @override_settings(CACHALOT_VERSIONED_CACHES=['cachalot_redis'])
+    def test_fetch_fresh_versions(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        (stamp, result), table_values = self.get_fresh_result(qs)
+        self.assertIsNotNone(result)
+        self.assertTupleEqual(stamp, tuple(table_values.values()))
+
+        t = Test.objects.create(name='test')
+        (stamp, result), table_values = self.get_fresh_result(qs)
+        self.assertIsNone(result)
+        self.assert_query_cached(qs, [t])
+
+    @override_settings(CACHALOT_STALE_WHILE_REVALIDATE={'cachalot.Test': 60})
+    def test_stale_while_revalidate(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        lock_key = '%s:revalidation' % cachalot_settings.CACHALOT_QUERY_KEYGEN(
+            qs.query.get_compiler(connection.alias))
+        caches['cachalot_redis'].add(lock_key, True, 60)
+        Test.objects.create(name='test')
+        # Redis does not return the stale result, it is fetched separately.
+        with self.assertNumQueries(0):
+            self.assertListEqual(list(qs.all()), [])
@@ -0,0 +1,160 @@
+import errno
+import json
+import os
+import socket
+from tempfile import TemporaryDirectory
+from threading import Event
+from time import time
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import override_settings
+
+from ..bus import InvalidationBus, UnixSocketTransport, invalidation_bus
+from ..cache import cachalot_caches
+from ..local_cache import local_result_cache
+from ..settings import cachalot_settings
+from .models import Test
+from .test_utils import TestUtilsMixin, FilteredTransactionTestCase
+
+
+class LocalCacheStub:
+    def __init__(self):
+        self.invalidated = []
+        self.received = Event()
+
+    def invalidate(self, table_cache_keys):
+        self.invalidated.extend(table_cache_keys)
+        self.received.set()
+
+    def clear(self):
+        pass
+
+
+@override_settings(CACHALOT_LOCAL_CACHE_MAX_SIZE=10 ** 6,
+                   CACHALOT_LOCAL_CACHE_STALENESS=60)
+class InvalidationBusTestCase(TestUtilsMixin, FilteredTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = TemporaryDirectory()
+        self.table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN(
+            connection.alias, Test._meta.db_table)
+
+    def tearDown(self):
+        invalidation_bus.stop()
+        self.directory.cleanup()
+        super().tearDown()
+
+    def bus_settings(self):
+        return self.settings(
+            CACHALOT_INVALIDATION_BUS='cachalot.bus.UnixSocketTransport',
+            CACHALOT_INVALIDATION_BUS_OPTIONS={'path': self.directory.name})
+
+    def test_broadcast(self):
+        with self.bus_settings():
+            # Another process.
+            other_bus = InvalidationBus()
+            local_cache = LocalCacheStub()
+            other_bus.connect(local_cache)
+            other_bus.listen()
+            try:
+                # Waits until the other process listens.
+                deadline = time() + 5
+                while not local_cache.received.is_set() and time() < deadline:
+                    invalidation_bus.publish(['ping'])
+                    local_cache.received.wait(0.05)
+
+                Test.objects.create(name='test')
+                deadline = time() + 5
+                while self.table_cache_key not in local_cache.invalidated \
+                        and time() < deadline:
+                    local_cache.received.wait(0.05)
+                self.assertIn(self.table_cache_key, local_cache.invalidated)
+            finally:
+                other_bus.stop()
+
+    def test_receive(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        cache_key = cachalot_settings.CACHALOT_QUERY_KEYGEN(
+            qs.query.get_compiler(connection.alias))
+        # Invalidations from other processes are not seen
+        # until the local result is validated again…
+        cachalot_caches.get_cache().set(self.table_cache_key, time() + 1)
+        with self.assertNumQueries(0):
+            list(qs.all())
+
+        # … unless they are received from the bus.
+        invalidation_bus.receive(json.dumps({
+            'sender': 'other', 'keys': [self.table_cache_key]}).encode())
+        self.assertIsNone(local_result_cache.get(cache_key))
+        with self.assertNumQueries(1):
+            list(qs.all())
+
+    def test_receive_own_and_invalid_messages(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        cache_key = cachalot_settings.CACHALOT_QUERY_KEYGEN(
+            qs.query.get_compiler(connection.alias))
+        for message in [
+                json.dumps({'sender': invalidation_bus.sender,
+                            'keys': [self.table_cache_key]}).encode(),
+                b'not JSON', b'[]', b'{"keys": []}']:
+            invalidation_bus.receive(message)
+            self.assertIsNotNone(local_result_cache.get(cache_key))
+
+    def test_fork(self):
+        sender = invalidation_bus.sender
+        self.assertEqual(invalidation_bus.sender, sender)
+        with patch('cachalot.bus.os.getpid', return_value=-1):
+            # A forked process receives the messages of its parent.
+            forked_sender = invalidation_bus.sender
+            self.assertNotEqual(forked_sender, sender)
+            local_cache = LocalCacheStub()
+            invalidation_bus.connect(local_cache)
+            try:
+                invalidation_bus.receive(json.dumps({
+                    'sender': sender,
+                    'keys': [self.table_cache_key]}).encode())
+            finally:
+                invalidation_bus.local_caches.remove(local_cache)
+            self.assertListEqual(local_cache.invalidated,
+                                 [self.table_cache_key])
+            self.assertEqual(invalidation_bus.sender, forked_sender)
+
+    def test_split_messages(self):
+        bus = InvalidationBus()
+        keys = ['table_%d' % i for i in range(200)]
+        messages = bus._get_messages(keys, 512)
+        self.assertGreater(len(messages), 1)
+        received = []
+        for message in messages:
+            self.assertLessEqual(len(message), 512)
+            received.extend(json.loads(message)['keys'])
+        self.assertListEqual(received, keys)
+
+        # Processes receiving a key too large for a message clear
+        # their local caches.
+        message, = bus._get_messages(['table' * 200], 512)
+        local_cache = LocalCacheStub()
+        local_cache.clear = lambda: local_cache.invalidated.append(None)
+        other_bus = InvalidationBus()
+        other_bus.connect(local_cache)
+        other_bus.receive(message)
+        self.assertListEqual(local_cache.invalidated, [None])
+
+    def test_send_error(self):
+        transport = UnixSocketTransport(self.directory.name)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.bind(os.path.join(self.directory.name, 'listener.sock'))
+            with patch.object(socket.socket, 'sendto', side_effect=OSError(
+                    errno.EMSGSIZE, os.strerror(errno.EMSGSIZE))), \
+                    self.assertLogs('cachalot.bus', 'WARNING'):
+                # Errors are not raised in the write sending them.
+                transport.publish(b'{}')
+
+    def test_disabled(self):
+        self.assertIsNone(invalidation_bus.get_transport())
+        with self.bus_settings():
+            self.assertIsNotNone(invalidation_bus.get_transport())
+        self.assertIsNone(invalidation_bus.get_transport())
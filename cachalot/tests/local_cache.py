@@ -0,0 +1,193 @@
+from time import time
+from unittest.mock import patch
+
+from django.db import connection, transaction
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from ..cache import cachalot_caches
+from ..local_cache import (
+    LocalResultCache, LocalTableCache, local_result_cache, local_table_cache)
+from ..settings import cachalot_settings
+from .models import Test
+from .test_utils import TestUtilsMixin, FilteredTransactionTestCase
+
+
+@override_settings(CACHALOT_LOCAL_CACHE_MAX_SIZE=10 ** 6)
+class LocalCacheTestCase(TestUtilsMixin, FilteredTransactionTestCase):
+    def get_query_cache_key(self, queryset):
+        return cachalot_settings.CACHALOT_QUERY_KEYGEN(
+            queryset.query.get_compiler(connection.alias))
+
+    def test_hit_without_shared_result(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        cache_key = self.get_query_cache_key(qs)
+        self.assertIsNotNone(local_result_cache.get(cache_key))
+
+        # The result is served by the local cache, only the table
+        # invalidation timestamps are read in the shared cache.
+        cachalot_caches.get_cache().delete(cache_key)
+        with self.assertNumQueries(0):
+            self.assertListEqual(list(qs.all()), [])
+
+    def test_invalidation(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        t = Test.objects.create(name='test')
+        self.assertIsNone(
+            local_result_cache.get(self.get_query_cache_key(qs)))
+        self.assert_query_cached(qs, [t])
+
+    def test_external_invalidation(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+
+        # Simulates an invalidation made by another process.
+        table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN(
+            connection.alias, Test._meta.db_table)
+        cachalot_caches.get_cache().set(table_cache_key, time() + 1)
+        with self.assertNumQueries(1):
+            list(qs.all())
+
+    @override_settings(CACHALOT_LOCAL_CACHE_STALENESS=60)
+    def test_staleness(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+
+        table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN(
+            connection.alias, Test._meta.db_table)
+        cachalot_caches.get_cache().set(table_cache_key, time() + 1)
+        with self.assertNumQueries(0):
+            list(qs.all())
+
+        # Local invalidations are always seen.
+        t = Test.objects.create(name='test')
+        self.assert_query_cached(qs, [t])
+
+    @override_settings(CACHALOT_LOCAL_CACHE_STALENESS=60)
+    def test_atomic(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+
+        with self.assertNumQueries(2):
+            with transaction.atomic():
+                t = Test.objects.create(name='test')
+                self.assertListEqual(list(qs.all()), [t])
+        self.assertListEqual(list(qs.all()), [t])
+
+    def test_rollback(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+
+        with self.assertNumQueries(2):
+            with transaction.atomic():
+                Test.objects.create(name='test')
+                list(qs.all())
+                transaction.set_rollback(True)
+        with self.assertNumQueries(0):
+            self.assertListEqual(list(qs.all()), [])
+
+
+@override_settings(CACHALOT_LOCAL_TABLE_CACHE_STALENESS=60)
+class LocalTableCacheTestCase(TestUtilsMixin, FilteredTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        local_table_cache.clear()
+        self.table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN(
+            connection.alias, Test._meta.db_table)
+
+    def test_staleness(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        cache = cachalot_caches.get_cache()
+        self.assertIn(self.table_cache_key,
+                      local_table_cache.get_many([self.table_cache_key]))
+
+        # Only the result is read in the shared cache.
+        with patch.object(cache, 'get_many',
+                          wraps=cache.get_many) as get_many:
+            with self.assertNumQueries(0):
+                self.assertListEqual(list(qs.all()), [])
+        self.assertEqual(get_many.call_count, 1)
+        self.assertNotIn(self.table_cache_key, get_many.call_args[0][0])
+
+        # Simulates an invalidation made by another process.
+        cache.set(self.table_cache_key, time() + 1)
+        with self.assertNumQueries(0):
+            list(qs.all())
+
+        # Local invalidations are always seen.
+        t = Test.objects.create(name='test')
+        self.assert_query_cached(qs, [t])
+
+    def test_atomic(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+
+        with self.assertNumQueries(2):
+            with transaction.atomic():
+                t = Test.objects.create(name='test')
+                self.assertListEqual(list(qs.all()), [t])
+        self.assert_query_cached(qs, [t])
+
+
+class LocalTableCacheUnitTestCase(SimpleTestCase):
+    @override_settings(CACHALOT_LOCAL_TABLE_CACHE_STALENESS=60)
+    def test_invalidate(self):
+        local_cache = LocalTableCache()
+        local_cache.set_many({'table1': 1.0, 'table2': 2.0}, time(),
+                             local_cache.invalidations)
+        self.assertDictEqual(local_cache.get_many(['table1', 'table3']),
+                             {'table1': 1.0})
+        invalidations = local_cache.invalidations
+        local_cache.invalidate(['table1'])
+        self.assertDictEqual(local_cache.get_many(['table1', 'table2']),
+                             {'table2': 2.0})
+        # Values fetched before an invalidation are not stored.
+        local_cache.set_many({'table1': 1.0}, time(), invalidations)
+        self.assertDictEqual(local_cache.get_many(['table1']), {})
+        local_cache.clear()
+        self.assertEqual(len(local_cache), 0)
+
+    @override_settings(CACHALOT_LOCAL_TABLE_CACHE_STALENESS=0.01)
+    def test_staleness(self):
+        local_cache = LocalTableCache()
+        local_cache.set_many({'table1': 1.0}, time() - 0.02,
+                             local_cache.invalidations)
+        self.assertDictEqual(local_cache.get_many(['table1']), {})
+
+
+class LocalResultCacheTestCase(SimpleTestCase):
+    @override_settings(CACHALOT_LOCAL_CACHE_MAX_SIZE=100)
+    def test_max_size(self):
+        local_cache = LocalResultCache()
+        local_cache.set('a', ['table1'], 0.0, [b'a' * 30])
+        local_cache.set('b', ['table2'], 0.0, [b'b' * 30])
+        self.assertEqual(len(local_cache), 2)
+        local_cache.get('a')
+        local_cache.set('c', ['table1'], 0.0, [b'c' * 30])
+        # 'b' is the least recently used entry.
+        self.assertIsNone(local_cache.get('b'))
+        self.assertIsNotNone(local_cache.get('a'))
+        self.assertIsNotNone(local_cache.get('c'))
+        self.assertLessEqual(local_cache.size, 100)
+
+        # Too large to ever be stored.
+        local_cache.set('d', [], 0.0, [b'd' * 200])
+        self.assertIsNone(local_cache.get('d'))
+
+    @override_settings(CACHALOT_LOCAL_CACHE_MAX_SIZE=1000)
+    def test_invalidate(self):
+        local_cache = LocalResultCache()
+        local_cache.set('a', ['table1', 'table2'], 0.0, [])
+        local_cache.set('b', ['table2'], 0.0, [])
+        local_cache.set('c', ['table3'], 0.0, [])
+        local_cache.invalidate(['table1'])
+        self.assertIsNone(local_cache.get('a'))
+        self.assertIsNotNone(local_cache.get('b'))
+        local_cache.invalidate(['table2'])
+        self.assertEqual(len(local_cache), 1)
+        local_cache.clear()
+        self.assertEqual(len(local_cache), 0)
+        self.assertEqual(local_cache.size, 0)
@@ -1,9 +1,14 @@
 from unittest import skipIf
+from unittest.mock import patch
 
 from django.conf import settings
+from django.core.cache import caches
 from django.db import DEFAULT_DB_ALIAS, connections, transaction
 from django.test import TransactionTestCase
+from django.test.utils import override_settings
 
+from ..api import invalidate
+from ..settings import cachalot_settings
 from .models import Test
 
 
@@ -117,3 +122,25 @@ class MultiDatabaseTestCase(TransactionTestCase):
         with self.assertNumQueries(1, using=self.db_alias2):
             data2 = list(Test.objects.using(self.db_alias2))
             self.assertListEqual(data2, [t3])
+
+    @override_settings(CACHALOT_VERSIONED_CACHES=())
+    def test_invalidate_all_databases_at_once(self):
+        real_cache = caches[cachalot_settings.CACHALOT_CACHE]
+        writes = []
+
+        def set_many(data, *args, **kwargs):
+            writes.append(set(data))
+            return original_set_many(data, *args, **kwargs)
+
+        original_set_many = real_cache.set_many
+        with patch.object(real_cache, 'set_many', set_many):
+            invalidate(Test)
+        self.assertListEqual(writes, [{
+            cachalot_settings.CACHALOT_TABLE_KEYGEN(db_alias,
+                                                    Test._meta.db_table)
+            for db_alias in settings.DATABASES}])
+
+        with self.assertNumQueries(1, using=self.db_alias2):
+            list(Test.objects.using(self.db_alias2))
+        with self.assertNumQueries(0, using=self.db_alias2):
+            list(Test.objects.using(self.db_alias2))
@@ -1,11 +1,17 @@
 from datetime import date, datetime
 from decimal import Decimal
+from time import sleep, time
+from types import SimpleNamespace
 from unittest import skipUnless
+from unittest.mock import patch
 
 from django import VERSION
 from django.contrib.postgres.functions import TransactionNow
-from django.db import connection
-from django.test import TransactionTestCase, override_settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import (
+    SimpleTestCase, TransactionTestCase, override_settings)
 
 # If we are using Django 4.2 or higher, we need to use:
 if VERSION >= (4, 2):
@@ -19,6 +25,8 @@ else:
 
 from pytz import timezone
 
+from ..api import _invalidate_cachalot_cache
+from ..postgres import PostgresListener, install_triggers, uninstall_triggers
 from ..utils import UncachableQuery
 from .api import invalidate
 from .models import PostgresModel, Test
@@ -459,3 +467,111 @@ class PostgresReadTestCase(TestUtilsMixin, TransactionTestCase):
         self.assert_query_cached(qs, [obj], after=1)
 
         obj.delete()
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'This test is only for PostgreSQL')
+class PostgresNotifyTestCase(TestUtilsMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        install_triggers([Test._meta.db_table])
+        self.listener = PostgresListener(max_delay=0).start()
+        # Another service writing directly in the database.
+        self.other_connection = connections.create_connection(
+            connection.alias)
+        self.other_connection.ensure_connection()
+
+    def tearDown(self):
+        self.listener.stop()
+        self.other_connection.close()
+        uninstall_triggers([Test._meta.db_table])
+        super().tearDown()
+
+    def count_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM pg_trigger "
+                "WHERE tgname = 'cachalot_notify' "
+                "AND tgrelid = %s::regclass", [Test._meta.db_table])
+            return cursor.fetchone()[0]
+
+    def test_external_write(self):
+        t = Test.objects.create(name='test')
+        qs = Test.objects.values_list('name', flat=True)
+        self.assert_query_cached(qs, ['test'])
+
+        deadline = time() + 5
+        while time() < deadline:
+            name = str(time())
+            with self.other_connection.connection.cursor() as cursor:
+                cursor.execute('UPDATE %s SET name = %%s WHERE id = %%s'
+                               % Test._meta.db_table,
+                               [name, t.pk])
+            sleep(0.1)
+            if list(qs.all()) == [name]:
+                break
+        self.assertListEqual(list(qs.all()), [name])
+
+    def test_cachalot_cache_only(self):
+        with patch('cachalot.postgres._invalidate_cachalot_cache',
+                   wraps=_invalidate_cachalot_cache) as invalidate_mock:
+            with self.other_connection.connection.cursor() as cursor:
+                cursor.execute('INSERT INTO %s (name, public) '
+                               "VALUES ('test', false)" % Test._meta.db_table)
+            deadline = time() + 5
+            while not invalidate_mock.called and time() < deadline:
+                sleep(0.05)
+        # Only the cache of django-cachalot is invalidated, like after
+        # writes made by Django.
+        invalidate_mock.assert_called_with(Test._meta.db_table,
+                                           db_alias=connection.alias)
+
+    def test_command(self):
+        self.assertEqual(self.count_triggers(), 1)
+        call_command('install_cachalot_triggers', 'cachalot.Test',
+                     '--uninstall', verbosity=0)
+        self.assertEqual(self.count_triggers(), 0)
+        call_command('install_cachalot_triggers', 'cachalot', verbosity=0)
+        self.assertEqual(self.count_triggers(), 1)
+
+
+class PostgresListenerTestCase(SimpleTestCase):
+    def test_retry_delay(self):
+        listener = PostgresListener()
+        listener.max_retry_delay = 3
+
+        def listen(invalidate_all=False):
+            listens.append(invalidate_all)
+            if len(listens) == 4:
+                listener._listening = True
+            if len(listens) == 6:
+                listener.stop()
+                return
+            raise OSError
+
+        listens = []
+        with patch.object(listener, 'listen', side_effect=listen), \
+                patch.object(listener._stop, 'wait') as wait, \
+                self.assertLogs('cachalot.postgres', 'ERROR') as logs:
+            listener.run()
+        # The delay is reset once listening worked again.
+        self.assertListEqual([c.args[0] for c in wait.call_args_list],
+                             [1, 2, 3, 1, 2])
+        self.assertEqual(len(logs.records), 5)
+        # The cache is only invalidated after losing a listening connection.
+        self.assertListEqual(listens,
+                             [False, False, False, False, True, True])
+
+    def test_unsupported_driver(self):
+        class Connection:
+            def notifies(self):
+                pass
+
+        database = SimpleNamespace(__name__='psycopg', Connection=Connection)
+        listener = PostgresListener()
+        with patch.object(type(connections[listener.db_alias]), 'Database',
+                          database):
+            with self.assertRaises(ImproperlyConfigured):
+                listener.start()
+            with self.assertRaises(ImproperlyConfigured):
+                listener.run()
@@ -2,6 +2,7 @@ import datetime
 from unittest import skipIf
 from uuid import UUID
 from decimal import Decimal
+from unittest import mock
 
 from django import VERSION as DJANGO_VERSION
 from django.conf import settings
@@ -13,13 +14,14 @@ from django.db import (
 from django.db.models import Case, Count, Q, Value, When
 from django.db.models.expressions import RawSQL, Subquery, OuterRef, Exists
 from django.db.models.functions import Coalesce, Now
+from django.db.models.sql.compiler import SQLCompiler
 from django.db.transaction import TransactionManagementError
 from django.test import TransactionTestCase, skipUnlessDBFeature, override_settings
 from pytz import UTC
 
 from cachalot.cache import cachalot_caches
 from ..settings import cachalot_settings
-from ..utils import UncachableQuery
+from ..utils import UncachableQuery, _hash_parameters
 from .models import SomeChoices, Test, TestChild, TestParent, UnmanagedModel
 from .test_utils import TestUtilsMixin, FilteredTransactionTestCase
 
@@ -406,6 +408,20 @@ class ReadTestCase(TestUtilsMixin, FilteredTransactionTestCase):
         )
         self.assert_query_cached(qs, [])
 
+    @all_final_sql_checks
+    def test_single_compilation(self):
+        qs = Test.objects.filter(
+            owner__in=User.objects.filter(groups__in=Group.objects.all()))
+        with mock.patch.object(SQLCompiler, 'as_sql', autospec=True,
+                               side_effect=SQLCompiler.as_sql) as as_sql:
+            with self.assertNumQueries(1):
+                self.assertListEqual(list(qs), [self.t1])
+        # No compiler is asked twice for the same SQL.
+        calls = [(id(c.args[0]), c.args[1:], tuple(c.kwargs.items()))
+                 for c in as_sql.call_args_list]
+        self.assertEqual(len(calls), len(set(calls)))
+        self.assert_query_cached(qs, [self.t1], before=0)
+
     @with_final_sql_check
     def test_custom_subquery_with_check(self):
         tests = Test.objects.filter(permission=OuterRef('pk')).values('name')
@@ -1300,3 +1316,46 @@ class ParameterTypeTestCase(TestUtilsMixin, TransactionTestCase):
             obj2 = qs.get()
         self.assertEqual(obj1, obj2)
         self.assertEqual(obj1, obj)
+
+    def test_large_in(self):
+        pks = list(range(1, 2000))
+        qs = Test.objects.filter(pk__in=pks)
+        self.assert_query_cached(qs)
+        # Only the last parameter changes, in the last batch of parameters.
+        self.assert_query_cached(Test.objects.filter(pk__in=pks[:-1] + [0]))
+
+    def test_typed_cache_key(self):
+        def get_cache_key(value):
+            # `extra` parameters are not converted by fields.
+            qs = Test.objects.extra(where=['name = %s'], params=[value])
+            return cachalot_settings.CACHALOT_QUERY_KEYGEN(
+                qs.query.get_compiler(DEFAULT_DB_ALIAS))
+
+        self.assertEqual(get_cache_key('1'), get_cache_key('1'))
+        self.assertNotEqual(get_cache_key('1'), get_cache_key(1))
+        self.assertNotEqual(get_cache_key('True'), get_cache_key(True))
+        self.assertNotEqual(get_cache_key('None'), get_cache_key(None))
+
+    def test_big_int_cache_key(self):
+        params = [1, 2 ** 70]
+        data = []
+        _hash_parameters(data.append, params, {int})
+        # Nothing is hashed before packing integers fails.
+        self.assertListEqual(data, [b'r', repr(params).encode('utf-8')])
+
+        def get_cache_key(value):
+            qs = Test.objects.extra(where=['id = %s'], params=[value])
+            return cachalot_settings.CACHALOT_QUERY_KEYGEN(
+                qs.query.get_compiler(DEFAULT_DB_ALIAS))
+
+        self.assertNotEqual(get_cache_key(2 ** 70), get_cache_key(2 ** 70 + 1))
+
+    def test_unambiguous_cache_key(self):
+        def get_cache_key(*params):
+            qs = Test.objects.extra(where=['name IN (%s, %s)'], params=params)
+            return cachalot_settings.CACHALOT_QUERY_KEYGEN(
+                qs.query.get_compiler(DEFAULT_DB_ALIAS))
+
+        self.assertNotEqual(get_cache_key('a\0', 'b'), get_cache_key('a', '\0b'))
+        self.assertNotEqual(get_cache_key(1, 2), get_cache_key(1, '2'))
+        self.assertNotEqual(get_cache_key(2 ** 70, 1), get_cache_key(1, 2 ** 70))
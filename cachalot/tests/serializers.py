@@ -0,0 +1,104 @@
+from datetime import date
+
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from ..cache import cachalot_caches
+from ..serializers import (
+    ChunkedResult, CompactResultSerializer, PickledResult)
+from ..settings import cachalot_settings
+from .models import Test
+from .test_utils import TestUtilsMixin, FilteredTransactionTestCase
+
+
+class CompactResultSerializerTestCase(SimpleTestCase):
+    def assert_round_trip(self, result):
+        serializer = CompactResultSerializer()
+        self.assertEqual(serializer.loads(serializer.dumps(result)), result)
+
+    def test_rows(self):
+        result = [
+            [(1, 'a', 1.5, None, date(2020, 1, 1)), (2, 'b', 2.5, True, None)],
+            [(3, 'c', -0.0, False, date(2021, 1, 1))],
+        ]
+        data = CompactResultSerializer().dumps(result)
+        self.assertIsInstance(data, bytes)
+        self.assert_round_trip(result)
+        self.assert_round_trip([[(2 ** 70, 1.0)]])
+        self.assert_round_trip([[(True,), (1,)]])
+
+    def test_compression(self):
+        result = [[(i, 'name %s' % (i % 10)) for i in range(100)]
+                  for _ in range(100)]
+        data = CompactResultSerializer().dumps(result)
+        self.assertTrue(data.startswith(CompactResultSerializer.COMPRESSED))
+        self.assertLess(len(data), CompactResultSerializer.compress_threshold)
+        self.assert_round_trip(result)
+
+    def test_other_results(self):
+        serializer = CompactResultSerializer()
+        for result in [(1, 'a'), [], [[]], [[(1,), (1, 2)]], [[[1]]], 3]:
+            self.assertIs(serializer.dumps(result), result)
+            self.assert_round_trip(result)
+
+    def test_bad_data(self):
+        with self.assertRaises(ValueError):
+            CompactResultSerializer().loads(
+                CompactResultSerializer.COMPRESSED + b'invalid')
+
+
+@override_settings(CACHALOT_RESULT_SERIALIZER=
+                   'cachalot.serializers.CompactResultSerializer')
+class CompactResultSerializerCacheTestCase(TestUtilsMixin,
+                                           FilteredTransactionTestCase):
+    def test_cached_query(self):
+        Test.objects.bulk_create([Test(name='test%s' % i, public=i % 2)
+                                  for i in range(150)])
+        qs = Test.objects.order_by('pk').values_list('name', 'public')
+        self.assert_query_cached(qs, [('test%s' % i, bool(i % 2))
+                                      for i in range(150)])
+
+        cache_key = cachalot_settings.CACHALOT_QUERY_KEYGEN(
+            qs.query.get_compiler(connection.alias))
+        timestamp, data = cachalot_caches.get_cache().get(cache_key)
+        self.assertIsInstance(data, bytes)
+
+        self.assert_query_cached(Test.objects.filter(name='test1'),
+                                 [Test.objects.get(name='test1')])
+
+
+class ChunkedResultTestCase(TestUtilsMixin, FilteredTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        Test.objects.bulk_create([Test(name='test%s' % i) for i in range(100)])
+        self.qs = Test.objects.order_by('pk').values_list('name', flat=True)
+        self.cache_key = cachalot_settings.CACHALOT_QUERY_KEYGEN(
+            self.qs.query.get_compiler(connection.alias))
+
+    @override_settings(CACHALOT_RESULT_CHUNK_SIZE=100)
+    def test_chunks(self):
+        self.assert_query_cached(self.qs, ['test%s' % i for i in range(100)])
+        cache = cachalot_caches.get_cache()
+        timestamp, chunked_result = cache.get(self.cache_key)
+        self.assertIsInstance(chunked_result, ChunkedResult)
+        chunk_keys = chunked_result.get_chunk_keys(self.cache_key)
+        self.assertGreater(len(chunk_keys), 1)
+        self.assertEqual(len(cache.get_many(chunk_keys)), len(chunk_keys))
+
+        # A missing chunk is a cache miss.
+        cache.delete(chunk_keys[-1])
+        self.assert_query_cached(self.qs, ['test%s' % i for i in range(100)])
+
+    @override_settings(CACHALOT_RESULT_CHUNK_SIZE=10 ** 6)
+    def test_small_result(self):
+        self.assert_query_cached(self.qs)
+        timestamp, result = cachalot_caches.get_cache().get(self.cache_key)
+        # The result is not pickled again by the cache backend.
+        self.assertIsInstance(result, PickledResult)
+        self.assertIsInstance(result.load(), list)
+
+    @override_settings(CACHALOT_MAX_RESULT_SIZE=100)
+    def test_max_size(self):
+        self.assert_query_cached(self.qs, after=1)
+        self.assert_query_cached(Test.objects.filter(name='test1'))
@@ -1,18 +1,22 @@
+from contextlib import ExitStack
 from time import sleep
 from unittest import skipIf
 from unittest.mock import MagicMock, patch
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
 from django.core.checks import Error, Tags, Warning, run_checks
-from django.db import connection
+from django.db import connection, transaction
 from django.test import TransactionTestCase
 from django.test.utils import override_settings
 
 from ..api import invalidate
-from ..settings import SUPPORTED_DATABASE_ENGINES, SUPPORTED_ONLY
-from ..utils import _get_tables
+from ..backends import RedisSerializer
+from ..cache import cachalot_caches
+from ..settings import (
+    SUPPORTED_DATABASE_ENGINES, SUPPORTED_ONLY, cachalot_settings)
+from ..utils import _get_generational_cache_key, _get_tables, _tables_memo
 from .models import Test, TestChild, TestParent, UnmanagedModel
 from .test_utils import TestUtilsMixin
 
@@ -70,6 +74,78 @@ class SettingsTestCase(TestUtilsMixin, TransactionTestCase):
         with self.settings(CACHALOT_CACHE=other_cache_alias):
             self.assert_query_cached(qs, before=0)
 
+    def test_table_cache(self):
+        table_cache_alias = next(alias for alias in settings.CACHES
+                                 if alias != DEFAULT_CACHE_ALIAS)
+        table_cache = caches[table_cache_alias]
+        result_cache = caches[DEFAULT_CACHE_ALIAS]
+        table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN(
+            connection.alias, Test._meta.db_table)
+        qs = Test.objects.all()
+
+        with self.settings(CACHALOT_TABLE_CACHE=table_cache_alias):
+            table_cache.clear()
+            result_cache.clear()
+            self.assert_query_cached(qs)
+            invalidation = table_cache.get(table_cache_key)
+            self.assertIsNotNone(invalidation)
+            self.assertIsNone(result_cache.get(table_cache_key))
+
+            # Invalidations are only written to the table cache.
+            t = Test.objects.create(name='test')
+            self.assertNotEqual(table_cache.get(table_cache_key), invalidation)
+            self.assertIsNone(result_cache.get(table_cache_key))
+            self.assert_query_cached(qs, [t])
+
+            # Evicting results keeps invalidations.
+            result_cache.clear()
+            self.assert_query_cached(qs, [t])
+            self.assertIsNotNone(table_cache.get(table_cache_key))
+
+            with transaction.atomic():
+                t2 = Test.objects.create(name='test2')
+                self.assert_query_cached(qs, [t, t2])
+            self.assertIsNone(result_cache.get(table_cache_key))
+            self.assert_query_cached(qs, [t, t2])
+
+        with self.settings(CACHALOT_TABLE_CACHE=table_cache_alias,
+                           CACHALOT_VERSIONED_CACHES=[table_cache_alias]):
+            table_cache.clear()
+            result_cache.clear()
+            # Table versions are created in the table cache transaction.
+            with transaction.atomic():
+                self.assert_query_cached(qs, [t, t2])
+            self.assertIsNotNone(table_cache.get(table_cache_key))
+            self.assert_query_cached(qs, [t, t2], before=0)
+
+    @override_settings(CACHALOT_CACHE=None)
+    def test_no_cache(self):
+        qs = Test.objects.all()
+        with ExitStack() as stack:
+            real_caches = [
+                stack.enter_context(patch.object(caches[alias], method))
+                for alias in settings.CACHES
+                for method in ('get_many', 'set_many', 'add', 'incr')]
+
+            # Results are not cached outside transactions.
+            self.assert_query_cached(qs, after=1)
+
+            with transaction.atomic():
+                self.assert_query_cached(qs)
+                t = Test.objects.create(name='test')
+                self.assert_query_cached(qs, [t])
+                with transaction.atomic():
+                    self.assert_query_cached(qs, [t], before=0)
+                    Test.objects.update(name='other')
+                    self.assert_query_cached(qs.values_list('name'),
+                                             [('other',)])
+
+            # And they are discarded when the transaction ends.
+            self.assert_query_cached(qs, [t], after=1)
+
+            for method in real_caches:
+                method.assert_not_called()
+
     def test_databases(self):
         qs = Test.objects.all()
         with self.settings(CACHALOT_DATABASES=SUPPORTED_ONLY):
@@ -114,6 +190,34 @@ class SettingsTestCase(TestUtilsMixin, TransactionTestCase):
             with self.assertNumQueries(1):
                 list(Test.objects.all())
 
+    def test_table_timeouts(self):
+        with self.settings(CACHALOT_TIMEOUT=1,
+                           CACHALOT_TABLE_TIMEOUTS={'cachalot.Test': 0,
+                                                    'auth': None}):
+            self.assertEqual(cachalot_settings.CACHALOT_TABLE_TIMEOUTS, {
+                'cachalot_test': 0, 'auth_user': None, 'auth_group': None,
+                'auth_permission': None, 'auth_user_groups': None,
+                'auth_group_permissions': None,
+                'auth_user_user_permissions': None})
+            qs = Test.objects.all()
+            with self.assertNumQueries(1):
+                list(qs.all())
+            sleep(0.05)
+            with self.assertNumQueries(1):
+                list(qs.all())
+
+            # The shortest timeout of the tables is used.
+            qs = User.objects.all()
+            self.assert_query_cached(qs)
+            self.assert_query_cached(Test.objects.select_related('owner'),
+                                     after=1)
+            sleep(1)
+            self.assert_query_cached(qs, before=0)
+            self.assert_query_cached(TestParent.objects.all())
+            sleep(1)
+            with self.assertNumQueries(1):
+                list(TestParent.objects.all())
+
     def test_cache_random(self):
         qs = Test.objects.order_by('?')
         self.assert_query_cached(qs, after=1, compare_results=False)
@@ -208,6 +312,149 @@ class SettingsTestCase(TestUtilsMixin, TransactionTestCase):
         ):
             self.assert_query_cached(qs, after=1)
 
+    @patch('cachalot.utils._get_tables', wraps=_get_tables)
+    def test_sql_memo_size(self, get_tables_mock):
+        with self.settings(CACHALOT_SQL_MEMO_SIZE=1000):
+            self.assert_query_cached(Test.objects.filter(name='a'))
+            self.assert_query_cached(Test.objects.filter(name='b'))
+            self.assertEqual(get_tables_mock.call_count, 1)
+
+            # The uncachable verdict is also memoized.
+            qs = Test.objects.order_by('?')
+            self.assert_query_cached(qs, after=1, compare_results=False)
+            self.assertEqual(get_tables_mock.call_count, 2)
+
+            # Long SQL queries are remembered by a short digest.
+            self.assert_query_cached(Test.objects.filter(pk__in=range(500)))
+            self.assertTrue(all(len(key) <= 20 for key in _tables_memo._data))
+
+        get_tables_mock.reset_mock()
+        with self.settings(CACHALOT_SQL_MEMO_SIZE=0):
+            self.assert_query_cached(Test.objects.filter(name='c'))
+            self.assert_query_cached(Test.objects.filter(name='d'))
+            self.assertEqual(get_tables_mock.call_count, 4)
+
+    @override_settings(CACHALOT_ADMISSION_MIN_MISSES=2)
+    def test_admission_min_misses(self):
+        qs = Test.objects.filter(name='test')
+        # The result is only cached after the second miss.
+        self.assert_query_cached(qs, after=1)
+        with self.assertNumQueries(0):
+            list(qs.all())
+
+        Test.objects.create(name='test')
+        # The query is already known to be frequent.
+        self.assert_query_cached(qs)
+
+    @override_settings(CACHALOT_TABLE_ADMISSION_MIN_MISSES={'cachalot.Test': 3})
+    def test_table_admission_min_misses(self):
+        self.assert_query_cached(TestParent.objects.all())
+        qs = Test.objects.all()
+        self.assert_query_cached(qs, after=1)
+        self.assert_query_cached(qs)
+        self.assert_query_cached(Test.objects.select_related('owner'),
+                                 after=1)
+
+    @override_settings(CACHALOT_STALE_WHILE_REVALIDATE={'cachalot.Test': 60})
+    def test_stale_while_revalidate(self):
+        qs = Test.objects.filter(name='test')
+        self.assert_query_cached(qs)
+        cache = cachalot_caches.get_cache()
+        lock_key = '%s:revalidation' % cachalot_settings.CACHALOT_QUERY_KEYGEN(
+            qs.query.get_compiler(connection.alias))
+
+        # Another process is already recomputing the result.
+        cache.add(lock_key, True, 60)
+        t = Test.objects.create(name='test')
+        with self.assertNumQueries(0):
+            self.assertListEqual(list(qs.all()), [])
+
+        # The result is recomputed by the first reader.
+        cache.delete(lock_key)
+        self.assert_query_cached(qs, [t])
+        self.assertIsNone(cache.get(lock_key))
+
+        # Stale results are recomputed even when not admitted yet.
+        with self.settings(CACHALOT_ADMISSION_MIN_MISSES=2):
+            t2 = Test.objects.create(name='test')
+            self.assert_query_cached(qs, [t, t2])
+        self.assertIsNone(cache.get(lock_key))
+        t2.delete()
+
+        # Outside the grace period, stale results are never returned.
+        with self.settings(
+                CACHALOT_STALE_WHILE_REVALIDATE={'cachalot.Test': 0.05}):
+            Test.objects.filter(pk=t.pk).update(name='other')
+            cache.add(lock_key, True, 60)
+            sleep(0.1)
+            self.assert_query_cached(qs, [])
+        cache.delete(lock_key)
+
+        # Stale results are not returned inside transactions.
+        with transaction.atomic():
+            Test.objects.create(name='test')
+            with self.assertNumQueries(1):
+                self.assertEqual(len(qs.all()), 1)
+
+        # Nor when other tables were invalidated.
+        Test.objects.create(name='test',
+                            owner=User.objects.create(username='a'))
+        qs = Test.objects.filter(owner__username='b')
+        self.assert_query_cached(qs, [])
+        User.objects.update(username='b')
+        with self.assertNumQueries(1):
+            self.assertEqual(len(qs.all()), 1)
+
+    @override_settings(CACHALOT_GENERATIONAL_KEYS=True)
+    def test_generational_keys(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        cache = cachalot_caches.get_cache()
+        cache_key = cachalot_settings.CACHALOT_QUERY_KEYGEN(
+            qs.query.get_compiler(connection.alias))
+        table_cache_keys = [cachalot_settings.CACHALOT_TABLE_KEYGEN(
+            connection.alias, Test._meta.db_table)]
+        old_cache_key = _get_generational_cache_key(
+            cache_key, cache.get_many(table_cache_keys), table_cache_keys)
+        self.assertIsNotNone(cache.get(old_cache_key))
+
+        # The stale result is never fetched again.
+        t = Test.objects.create(name='test')
+        with patch.object(cache, 'get_many',
+                          wraps=cache.get_many) as get_many:
+            self.assert_query_cached(qs, [t])
+        for call in get_many.call_args_list:
+            self.assertNotIn(old_cache_key, call.args[0])
+        self.assertIsNotNone(cache.get(old_cache_key))
+
+    @override_settings(
+        CACHALOT_QUERY_KEYGEN='cachalot.utils.get_blake2b_query_cache_key')
+    def test_query_keygen(self):
+        qs = Test.objects.filter(name='test')
+        self.assert_query_cached(qs)
+        cache_key = cachalot_settings.CACHALOT_QUERY_KEYGEN(
+            qs.query.get_compiler(connection.alias))
+        self.assertEqual(len(cache_key), 32)
+        self.assertIsNotNone(cachalot_caches.get_cache().get(cache_key))
+
+    @override_settings(
+        CACHALOT_QUERY_KEYGEN='cachalot.utils.get_hash_tagged_query_cache_key',
+        CACHALOT_TABLE_KEYGEN='cachalot.utils.get_hash_tagged_table_cache_key')
+    def test_hash_tagged_keygens(self):
+        qs = Test.objects.select_related('owner')
+        compiler = qs.query.get_compiler(connection.alias)
+        hash_tag = '{%s}' % connection.alias
+        self.assertTrue(cachalot_settings.CACHALOT_QUERY_KEYGEN(
+            compiler).startswith(hash_tag))
+        for table in (Test._meta.db_table, User._meta.db_table):
+            self.assertTrue(cachalot_settings.CACHALOT_TABLE_KEYGEN(
+                connection.alias, table).startswith(hash_tag))
+
+        self.assert_query_cached(qs)
+        user = User.objects.create_user('user')
+        t = Test.objects.create(name='test', owner=user)
+        self.assert_query_cached(qs, [t])
+
     def test_cache_compatibility(self):
         compatible_cache = {
             'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
@@ -237,6 +484,40 @@ class SettingsTestCase(TestUtilsMixin, TransactionTestCase):
             errors = run_checks(tags=[Tags.compatibility])
             self.assertListEqual(errors, [warning001])
 
+    @skipIf(RedisSerializer is None, 'Django has no Redis cache backend')
+    def test_fetch_fresh_compatibility(self):
+        redis_cache = {
+            'BACKEND': 'cachalot.backends.CachalotRedisCache',
+            'LOCATION': 'redis://127.0.0.1:6379/0',
+        }
+        caches_settings = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'redis': redis_cache,
+        }
+
+        with self.settings(CACHES=caches_settings, CACHALOT_CACHE='redis'):
+            errors = run_checks(tags=[Tags.compatibility])
+            self.assertListEqual(errors, [])
+
+        warning005 = Warning(
+            'Cache backend %r cannot validate query results on the '
+            'server when `CACHALOT_TABLE_CACHE` is another cache.'
+            % 'cachalot.backends.CachalotRedisCache',
+            hint='Remove `CACHALOT_TABLE_CACHE`, or use the Redis '
+                 'backend of Django or django-redis for '
+                 '`CACHALOT_CACHE`.',
+            id='cachalot.W005')
+        with self.settings(CACHES=caches_settings, CACHALOT_CACHE='redis',
+                           CACHALOT_TABLE_CACHE='default'):
+            errors = run_checks(tags=[Tags.compatibility])
+            self.assertListEqual(errors, [warning005])
+        with self.settings(CACHES=caches_settings, CACHALOT_CACHE='default',
+                           CACHALOT_TABLE_CACHE='redis'):
+            errors = run_checks(tags=[Tags.compatibility])
+            self.assertListEqual(errors, [])
+
     def test_database_compatibility(self):
         compatible_database = {
             'ENGINE': 'django.db.backends.sqlite3',
@@ -0,0 +1,63 @@
+from django.db import connection
+from django.db.models.signals import post_migrate
+from django.test import SimpleTestCase, TransactionTestCase
+from django.test.utils import override_settings
+
+from ..utils import _TableMatcher, _get_tables_from_sql, _table_matchers
+from .models import Test, TestChild, TestParent
+
+
+class TableMatcherTestCase(SimpleTestCase):
+    def assert_found(self, names, sql):
+        matcher = _TableMatcher({name: name for name in names})
+        self.assertSetEqual(matcher.find(sql),
+                            {name for name in names if name in sql})
+
+    def test_find(self):
+        names = ['cachalot_test', 'cachalot_testparent', 'cachalot_testchild',
+                 'test', 'parent', 'auth_user', 'auth_user_groups', 'a']
+        self.assert_found(names, 'select * from cachalot_testparent')
+        self.assert_found(names, 'select * from "cachalot_testchild" '
+                                 'inner join "auth_user_groups"')
+        self.assert_found(names, 'update auth_user set x = 1')
+        self.assert_found(names, 'select 1')
+        self.assert_found(names, '')
+
+    def test_no_names(self):
+        self.assertSetEqual(_TableMatcher({}).find('select * from test'),
+                            set())
+
+    def test_quoted_names(self):
+        matcher = _TableMatcher({'"test"': 'test',
+                                 '"testparent"': 'testparent'})
+        self.assertSetEqual(matcher.find('select * from "testparent"'),
+                            {'testparent'})
+        self.assertSetEqual(matcher.find('select * from "test", "testparent"'),
+                            {'test', 'testparent'})
+
+
+class TablesFromSQLTestCase(TransactionTestCase):
+    def test_quote(self):
+        sql = 'select * from %s' % connection.ops.quote_name(
+            TestParent._meta.db_table)
+        self.assertSetEqual(
+            _get_tables_from_sql(connection, sql),
+            {Test._meta.db_table, TestParent._meta.db_table})
+        self.assertSetEqual(
+            _get_tables_from_sql(connection, sql, enable_quote=True),
+            {TestParent._meta.db_table})
+
+    def test_additional_tables(self):
+        sql = 'select * from external_table, %s' % TestChild._meta.db_table
+        tables = {Test._meta.db_table, TestChild._meta.db_table}
+        self.assertSetEqual(_get_tables_from_sql(connection, sql), tables)
+        with override_settings(CACHALOT_ADDITIONAL_TABLES=['external_table']):
+            self.assertSetEqual(_get_tables_from_sql(connection, sql),
+                                tables | {'external_table'})
+
+    def test_rebuilt_after_migration(self):
+        _get_tables_from_sql(connection, 'select 1')
+        self.assertTrue(_table_matchers)
+        post_migrate.send(Test._meta.app_config, using=connection.alias,
+                          app_config=Test._meta.app_config)
+        self.assertFalse(_table_matchers)
@@ -1,8 +1,13 @@
-from threading import Thread
+from threading import Lock, Thread, Timer
+from time import sleep, time
 
 from django.db import connection, transaction
-from django.test import skipUnlessDBFeature
+from django.test import SimpleTestCase, skipUnlessDBFeature
+from django.test.utils import override_settings
 
+from ..cache import cachalot_caches
+from ..monkey_patch import _get_result_or_execute_query
+from ..single_flight import flights
 from .models import Test
 from .test_utils import TestUtilsMixin, FilteredTransactionTestCase
 
@@ -118,3 +123,69 @@ class ThreadSafetyTestCase(TestUtilsMixin, FilteredTransactionTestCase):
         with self.assertNumQueries(0):
             data = Test.objects.first()
         self.assertEqual(data, t)
+
+
+@override_settings(CACHALOT_SINGLE_FLIGHT=True)
+class SingleFlightTestCase(SimpleTestCase):
+    def setUp(self):
+        self.cache = cachalot_caches.get_cache()
+        self.cache_key = 'single_flight_test'
+        self.table_cache_keys = ['single_flight_test_table']
+        self.cache.delete_many([self.cache_key] + self.table_cache_keys)
+        self.executions = 0
+        self.execution_lock = Lock()
+
+    def execute_query(self):
+        with self.execution_lock:
+            self.executions += 1
+        sleep(0.2)
+        return [[(1,)]]
+
+    def get_result(self, results):
+        results.append(_get_result_or_execute_query(
+            self.execute_query, self.cache, 'default', self.cache_key,
+            self.table_cache_keys, None))
+
+    def run_threads(self, count):
+        results = []
+        threads = [Thread(target=self.get_result, args=(results,))
+                   for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_threads(self):
+        results = self.run_threads(5)
+        self.assertEqual(self.executions, 1)
+        self.assertListEqual(results, [[[(1,)]]] * 5)
+
+    def test_other_process(self):
+        # Another process is executing the query.
+        lease_key = '%s:flight' % self.cache_key
+        self.cache.add(lease_key, 0, 5)
+        Timer(0.1, self.cache.set_many, args=({
+            self.cache_key: (time(), [[(2,)]]),
+            self.table_cache_keys[0]: time() - 1,
+        },)).start()
+        self.assertListEqual(self.run_threads(3), [[[(2,)]]] * 3)
+        self.assertEqual(self.executions, 0)
+
+        # The lease is released without caching any result.
+        self.cache.delete(self.cache_key)
+        self.cache.add(lease_key, 0, 5)
+        Timer(0.1, self.cache.delete, args=(lease_key,)).start()
+        self.assertListEqual(self.run_threads(1), [[[(1,)]]])
+        self.assertEqual(self.executions, 1)
+
+    def test_later_invalidation(self):
+        # Results from queries started before an invalidation
+        # known by the current thread are not shared with it.
+        flight, _ = flights.join(self.cache_key)
+        try:
+            self.cache.set(self.table_cache_keys[0], time() + 1)
+            self.assertListEqual(self.run_threads(1), [[[(1,)]]])
+            self.assertEqual(self.executions, 1)
+        finally:
+            flights.land(self.cache_key, flight)
@@ -1,7 +1,10 @@
+from unittest.mock import patch
+
+from cachalot.settings import cachalot_settings
 from cachalot.transaction import AtomicCache
 
 from django.contrib.auth.models import User
-from django.core.cache import cache
+from django.core.cache import cache, caches
 from django.db import transaction, connection, IntegrityError
 from django.test import SimpleTestCase, skipUnlessDBFeature
 
@@ -171,6 +174,28 @@ class AtomicTestCase(TestUtilsMixin, FilteredTransactionTestCase):
             data3 = list(Test.objects.all())
         self.assertListEqual(data3, [t1])
     
+    def test_nested_invalidations_written_once(self):
+        table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN(
+            connection.alias, Test._meta.db_table)
+        real_cache = caches[cachalot_settings.CACHALOT_CACHE]
+        written_keys = []
+
+        def set_many(data, *args, **kwargs):
+            written_keys.extend(data)
+            return original_set_many(data, *args, **kwargs)
+
+        original_set_many = real_cache.set_many
+        with patch.object(real_cache, 'set_many', set_many):
+            with transaction.atomic():
+                Test.objects.create(name='test1')
+                with transaction.atomic():
+                    Test.objects.create(name='test2')
+                    with transaction.atomic():
+                        Test.objects.create(name='test3')
+                    self.assertListEqual(written_keys, [])
+        self.assertEqual(written_keys.count(table_cache_key), 1)
+        self.assert_query_cached(Test.objects.all())
+
     @skipUnlessDBFeature('can_defer_constraint_checks')
     def test_deferred_error(self):
         """
@@ -0,0 +1,95 @@
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+
+from ..api import get_last_invalidation, invalidate
+from ..cache import cachalot_caches
+from ..settings import cachalot_settings
+from .models import Test
+from .test_utils import TestUtilsMixin
+
+
+@override_settings(CACHALOT_VERSIONED_CACHES=tuple(settings.CACHES))
+class VersionedCacheTestCase(TestUtilsMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        # Timestamps left by other tests are not versions.
+        caches[cachalot_settings.CACHALOT_CACHE].clear()
+
+    def get_version(self, table=Test._meta.db_table):
+        return caches[cachalot_settings.CACHALOT_CACHE].get(
+            cachalot_settings.CACHALOT_TABLE_KEYGEN(connection.alias, table))
+
+    def test_invalidation(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        version = self.get_version()
+        self.assertIsInstance(version, int)
+
+        t = Test.objects.create(name='test')
+        self.assertEqual(self.get_version(), version + 1)
+        self.assert_query_cached(qs, [t])
+
+        invalidate(Test)
+        self.assertEqual(self.get_version(), version + 2)
+        self.assert_query_cached(qs, [t])
+
+    def test_clock_independence(self):
+        qs = Test.objects.all()
+        # Clocks going back in time do not return stale results.
+        with mock.patch('cachalot.monkey_patch.time', return_value=10 ** 10), \
+                mock.patch('cachalot.utils.time', return_value=10 ** 10):
+            self.assert_query_cached(qs)
+        with mock.patch('cachalot.monkey_patch.time', return_value=0), \
+                mock.patch('cachalot.utils.time', return_value=0):
+            t = Test.objects.create(name='test')
+            self.assert_query_cached(qs, [t])
+
+    def test_missing_version(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+
+        # An evicted counter starts again from another value,
+        # so that results computed with the previous counter are stale.
+        version = self.get_version()
+        cachalot_caches.get_cache().delete(
+            cachalot_settings.CACHALOT_TABLE_KEYGEN(
+                connection.alias, Test._meta.db_table))
+        self.assert_query_cached(qs)
+        self.assertNotEqual(self.get_version(), version)
+
+    def test_transaction(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        version = self.get_version()
+
+        with transaction.atomic():
+            t = Test.objects.create(name='test')
+            self.assert_query_cached(qs, [t])
+            # The real counter is only incremented on commit.
+            self.assertEqual(self.get_version(), version)
+        self.assertNotEqual(self.get_version(), version)
+        self.assert_query_cached(qs, [t])
+
+        with self.assertRaises(ZeroDivisionError):
+            with transaction.atomic():
+                Test.objects.create(name='rolled back')
+                1 / 0
+        self.assert_query_cached(qs, [t], before=0)
+
+    @override_settings(CACHALOT_LOCAL_CACHE_MAX_SIZE=10 ** 6)
+    def test_local_cache(self):
+        qs = Test.objects.all()
+        self.assert_query_cached(qs)
+        cachalot_caches.get_cache().incr(
+            cachalot_settings.CACHALOT_TABLE_KEYGEN(
+                connection.alias, Test._meta.db_table))
+        self.assert_query_cached(qs)
+
+    def test_get_last_invalidation(self):
+        Test.objects.create(name='test')
+        self.assertEqual(get_last_invalidation(Test), 0.0)
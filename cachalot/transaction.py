@@ -1,15 +1,20 @@
+from collections import defaultdict
+
 from .settings import cachalot_settings
 
 
 class AtomicCache(dict):
-    def __init__(self, parent_cache, db_alias):
+    def __init__(self, parent_cache, db_alias, versioned=False):
         super().__init__()
         self.parent_cache = parent_cache
         self.db_alias = db_alias
+        self.versioned = versioned
         self.to_be_invalidated = set()
+        self.timeouts = {}
 
     def set(self, k, v, timeout):
         self[k] = v
+        self.timeouts[k] = timeout
 
     def get_many(self, keys):
         data = {k: self[k] for k in keys if k in self}
@@ -20,15 +25,35 @@ class AtomicCache(dict):
 
     def set_many(self, data, timeout):
         self.update(data)
+        self.timeouts.update(dict.fromkeys(data, timeout))
 
-    def commit(self):
+    def commit(self, invalidate=True):
         # We import this here to avoid a circular import issue.
         from .utils import _invalidate_tables
 
-        if self:
-            self.parent_cache.set_many(
-                self, cachalot_settings.CACHALOT_TIMEOUT)
+        parent_cache = self.parent_cache
+        if isinstance(parent_cache, AtomicCache):
+            # Nested levels are merged into their parent, the real cache
+            # is only written when committing the outermost level.
+            parent_cache.update(self)
+            parent_cache.timeouts.update(self.timeouts)
+            parent_cache.to_be_invalidated.update(self.to_be_invalidated)
+            return
+
+        # Invalidated tables are written once, by `_invalidate_tables`.
+        get_table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN
+        invalidated_keys = {get_table_cache_key(self.db_alias, table)
+                            for table in self.to_be_invalidated}
+        data_per_timeout = defaultdict(dict)
+        for k, v in self.items():
+            if k not in invalidated_keys:
+                data_per_timeout[self.timeouts.get(
+                    k, cachalot_settings.CACHALOT_TIMEOUT)][k] = v
+        for timeout, data in data_per_timeout.items():
+            parent_cache.set_many(data, timeout)
         # The previous `set_many` is not enough.  The parent cache needs to be
         # invalidated in case another transaction occurred in the meantime.
-        _invalidate_tables(self.parent_cache, self.db_alias,
-                           self.to_be_invalidated)
+        # Unless an invalidation batch does it later.
+        if invalidate:
+            _invalidate_tables(parent_cache, self.db_alias,
+                               self.to_be_invalidated, self.versioned)
@@ -1,6 +1,11 @@
 import datetime
+import re
+from array import array
+from collections import OrderedDict, defaultdict
 from decimal import Decimal
-from hashlib import sha1
+from hashlib import blake2b, sha1
+from random import randrange
+from threading import Lock
 from time import time
 from typing import TYPE_CHECKING
 from uuid import UUID
@@ -13,6 +18,11 @@ from django.db.models.functions import Now
 from django.db.models.sql import Query, AggregateQuery
 from django.db.models.sql.where import ExtraWhere, WhereNode, NothingNode
 
+from .backends import incr_versions
+from .bus import invalidation_bus
+from .cache import SplitCache
+from .local_cache import local_result_cache, local_table_cache
+from .memo import MemoCache
 from .settings import ITERABLES, cachalot_settings
 from .transaction import AtomicCache
 
@@ -73,7 +83,20 @@ except ImportError:
         pass
 
 
+# Classes whose ``repr`` only depends on the value, so they can be hashed
+# directly in query cache keys.
+REPR_PARAM_TYPES = frozenset((
+    bool, int, float, Decimal, bytearray, bytes, str, type(None),
+    datetime.date, datetime.timedelta, UUID,
+))
+PARAMS_BATCH_SIZE = 512
+
+
 def check_parameter_types(params):
+    # Only checking the distinct classes is much faster on large queries,
+    # such as ``IN (…)`` with thousands of parameters.
+    if CACHABLE_PARAM_TYPES.issuperset(map(type, params)):
+        return
     for p in params:
         cl = p.__class__
         if cl not in CACHABLE_PARAM_TYPES:
@@ -90,6 +113,76 @@ def check_parameter_types(params):
                 raise UncachableQuery
 
 
+def _encode_parameter(p):
+    cl = type(p)
+    if cl in REPR_PARAM_TYPES:
+        return p
+    if cl in ITERABLES:
+        values = [_encode_parameter(v) for v in p]
+        if cl in (set, frozenset):
+            # Set iteration order changes from one process to another.
+            values = sorted(map(repr, values))
+        return cl.__name__, values
+    if cl is dict:
+        return cl.__name__, [_encode_parameter(item) for item in p.items()]
+    return cl.__qualname__, str(p)
+
+
+def _hash_parameters(update, params, classes):
+    """
+    Feeds an unambiguous, typed representation of ``params``
+    to the ``update`` method of a hash object.
+
+    Parameters only made of integers or of strings are packed at C speed,
+    other parameters are represented in batches to keep temporary strings
+    small on queries with thousands of parameters.
+    """
+    if classes == {int}:
+        try:
+            packed = array('q', params).tobytes()
+        except OverflowError:
+            # Integers beyond 64 bits are represented like other parameters.
+            pass
+        else:
+            update(b'i')
+            update(packed)
+            return
+    elif classes == {str}:
+        update(b's')
+        update(array('q', map(len, params)).tobytes())
+        update('\0'.join(params).encode('utf-8', 'surrogatepass'))
+        return
+    update(b'r')
+    encode = (None if REPR_PARAM_TYPES.issuperset(classes)
+              else _encode_parameter)
+    for i in range(0, len(params), PARAMS_BATCH_SIZE):
+        batch = params[i:i + PARAMS_BATCH_SIZE]
+        if encode is not None:
+            batch = [encode(p) for p in batch]
+        update(repr(batch).encode('utf-8'))
+
+
+def _get_query_cache_key(compiler, hash_func):
+    sql, params = compiler.as_sql()
+    classes = set(map(type, params))
+    if not CACHABLE_PARAM_TYPES.issuperset(classes):
+        check_parameter_types(params)
+    hasher = hash_func(('%s\0%s\0' % (compiler.using, sql)).encode('utf-8'))
+    # Identifies the SQL without its parameters, in a few bytes
+    # whatever the length of the SQL.
+    compiler.__cachalot_sql_digest = hasher.copy().digest()
+    _hash_parameters(hasher.update, params, classes)
+    # Set attribute on compiler for later access
+    # to the generated SQL. This prevents another as_sql() call!
+    compiler.__cachalot_generated_sql = sql.lower()
+
+    return hasher.hexdigest()
+
+
+def _blake2b_128(data):
+    return blake2b(data, digest_size=16)
+
+
 def get_query_cache_key(compiler):
     """
     Generates a cache key from a SQLCompiler.
@@ -103,15 +196,20 @@ def get_query_cache_key(compiler):
     :return: A cache key
     :rtype: int
     """
-    sql, params = compiler.as_sql()
-    check_parameter_types(params)
-    cache_key = '%s:%s:%s' % (compiler.using, sql,
-                              [str(p) for p in params])
-    # Set attribute on compiler for later access
-    # to the generated SQL. This prevents another as_sql() call!
-    compiler.__cachalot_generated_sql = sql.lower()
+    return _get_query_cache_key(compiler, sha1)
 
-    return sha1(cache_key.encode('utf-8')).hexdigest()
+
+def get_blake2b_query_cache_key(compiler):
+    """
+    Same as :func:`get_query_cache_key`, but hashed with a 128 bits BLAKE2b
+    digest, which gives shorter cache keys.
+
+    :arg compiler: A SQLCompiler that will generate the SQL query
+    :type compiler: django.db.models.sql.compiler.SQLCompiler
+    :return: A cache key
+    :rtype: str
+    """
+    return _get_query_cache_key(compiler, _blake2b_128)
 
 
 def get_table_cache_key(db_alias, table):
@@ -129,11 +227,213 @@ def get_table_cache_key(db_alias, table):
     return sha1(cache_key.encode('utf-8')).hexdigest()
 
 
+def get_hash_tagged_query_cache_key(compiler):
+    """
+    Same as :func:`get_query_cache_key`, but starting with the database alias
+    as a Redis Cluster hash tag, like ``{default}``.  Used with
+    :func:`get_hash_tagged_table_cache_key`, a query result and the
+    invalidations of its tables are stored in the same hash slot,
+    so they are fetched from a single node in a single request.
+
+    :arg compiler: A SQLCompiler that will generate the SQL query
+    :type compiler: django.db.models.sql.compiler.SQLCompiler
+    :return: A cache key
+    :rtype: str
+    """
+    return '{%s}%s' % (compiler.using, _get_query_cache_key(compiler, sha1))
+
+
+def get_hash_tagged_table_cache_key(db_alias, table):
+    """
+    Same as :func:`get_table_cache_key`, but starting with the database alias
+    as a Redis Cluster hash tag, like ``{default}``.
+
+    :arg db_alias: Alias of the used database
+    :type db_alias: str or unicode
+    :arg table: Name of the SQL table
+    :type table: str or unicode
+    :return: A cache key
+    :rtype: str
+    """
+    return '{%s}%s' % (db_alias, get_table_cache_key(db_alias, table))
+
+
+class _TableMatcher:
+    """
+    Finds in a single pass all the tables whose (possibly quoted) names
+    appear in a SQL query, whatever the number of tables.
+
+    Names are compiled into a single trie-shaped regular expression.
+    A lookahead returns the longest name starting at each position,
+    then names that are substrings of a found name are added as well,
+    so that the result is identical to testing each name one by one.
+    """
+
+    def __init__(self, names_to_tables):
+        self.regex = None
+        self.tables_per_name = {}
+        if not names_to_tables:
+            return
+        self.regex = re.compile('(?=(%s))' % self._get_trie_pattern(
+            names_to_tables))
+        for name in names_to_tables:
+            tables = set()
+            for match in self.regex.finditer(name):
+                start = match.start()
+                for end in range(start + 1, start + len(match.group(1)) + 1):
+                    table = names_to_tables.get(name[start:end])
+                    if table is not None:
+                        tables.add(table)
+            self.tables_per_name[name] = frozenset(tables)
+
+    @staticmethod
+    def _get_trie_pattern(names):
+        trie = {}
+        for name in names:
+            node = trie
+            for char in name:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        def build(node):
+            alternatives = [re.escape(char) + build(child)
+                            for char, child in sorted(node.items()) if char]
+            if not alternatives:
+                return ''
+            if len(alternatives) == 1 and '' not in node:
+                return alternatives[0]
+            return '(?:%s)%s' % ('|'.join(alternatives),
+                                 '?' if '' in node else '')
+
+        return build(trie)
+
+    def find(self, sql):
+        if self.regex is None:
+            return set()
+        tables_per_name = self.tables_per_name
+        return set().union(*[tables_per_name[name]
+                             for name in set(self.regex.findall(sql))])
+
+
+_table_matchers = {}
+
+
+def _get_table_matcher(connection, enable_quote):
+    key = (connection.alias, enable_quote)
+    matcher = _table_matchers.get(key)
+    if matcher is None:
+        tables = (connection.introspection.django_table_names()
+                  + cachalot_settings.CACHALOT_ADDITIONAL_TABLES)
+        matcher = _TableMatcher({
+            _quote_table_name(table, connection, enable_quote): table
+            for table in tables})
+        _table_matchers[key] = matcher
+    return matcher
+
+
+class _SQLMemo:
+    """
+    Bounded LRU mapping digests of ``(db_alias, sql)`` to what was computed
+    from the query tree having this SQL, so that queries with the same shape
+    but different parameters skip the tree walk entirely.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        max_size = cachalot_settings.CACHALOT_SQL_MEMO_SIZE
+        if max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            while len(self._data) > max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_tables_memo = _SQLMemo()
+# Memoized verdict of queries that can’t be cached.
+_UNCACHABLE = object()
+
+
+# Per-table settings converted to table cache keys,
+# by setting name and database alias.
+_table_cache_key_settings = {}
+
+
+def _clear_memos():
+    """
+    Forgets what was computed from table names and settings,
+    typically after a migration or a settings change.
+    """
+    _table_matchers.clear()
+    _tables_memo.clear()
+    _table_cache_key_settings.clear()
+
+
+def _get_table_cache_key_setting(setting_name, db_alias):
+    values_per_key = _table_cache_key_settings.get((setting_name, db_alias))
+    if values_per_key is None:
+        get_table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN
+        values_per_key = {
+            get_table_cache_key(db_alias, table): value
+            for table, value in getattr(cachalot_settings,
+                                        setting_name).items()}
+        _table_cache_key_settings[setting_name, db_alias] = values_per_key
+    return values_per_key
+
+
+def _get_table_setting_values(setting_name, db_alias, table_cache_keys):
+    """
+    Returns the values of a per-table setting for the tables
+    of ``table_cache_keys``, skipping tables missing from this setting.
+    """
+    values_per_key = _get_table_cache_key_setting(setting_name, db_alias)
+    if not values_per_key:
+        return []
+    return [values_per_key[k] for k in table_cache_keys
+            if k in values_per_key]
+
+
+def _get_timeout(db_alias, table_cache_keys, query=None):
+    """
+    Returns the timeout of a query result: the timeout set on ``query``
+    using :func:`cachalot.api.set_cache_timeout`, otherwise the shortest
+    timeout of its tables.
+    """
+    try:
+        return query.cachalot_timeout
+    except AttributeError:
+        pass
+    timeout = cachalot_settings.CACHALOT_TIMEOUT
+    timeouts = _get_table_setting_values('CACHALOT_TABLE_TIMEOUTS',
+                                         db_alias, table_cache_keys)
+    if not timeouts:
+        return timeout
+    if len(timeouts) < len(table_cache_keys):
+        timeouts.append(timeout)
+    timeouts = [t for t in timeouts if t is not None]
+    return min(timeouts) if timeouts else None
+
+
 def _get_tables_from_sql(connection, lowercased_sql, enable_quote: bool = False):
     """Returns names of involved tables after analyzing the final SQL query."""
-    return {table for table in (connection.introspection.django_table_names()
-            + cachalot_settings.CACHALOT_ADDITIONAL_TABLES)
-            if _quote_table_name(table, connection, enable_quote) in lowercased_sql}
+    return _get_table_matcher(connection, enable_quote).find(lowercased_sql)
 
 
 def _quote_table_name(table_name, connection, enable_quote: bool):
@@ -223,7 +523,18 @@ def _flatten(expression: 'BaseExpression'):
                 yield expr
 
 
-def _get_tables(db_alias, query, compiler=False):
+def _get_lowercased_sql(db_alias, query, compiler):
+    if compiler:
+        # Access generated SQL stored when caching the query!
+        sql = getattr(compiler, '__cachalot_generated_sql', None)
+        if sql is not None:
+            return sql
+    else:
+        compiler = query.get_compiler(db_alias)
+    return compiler.as_sql()[0].lower()
+
+
+def _get_tables(db_alias, query, compiler=False, is_subquery=False):
     from django.db import connections
 
     if query.select_for_update or (
@@ -248,40 +559,43 @@ def _get_tables(db_alias, query, compiler=False):
                 if isinstance(expression, Subquery):
                     # Django 2.2 only: no query, only queryset
                     if not hasattr(expression, 'query'):
-                        tables.update(_get_tables(db_alias, expression.queryset.query))
+                        tables.update(_get_tables(
+                            db_alias, expression.queryset.query,
+                            is_subquery=True))
                     # Django 3+
                     else:
-                        tables.update(_get_tables(db_alias, expression.query))
+                        tables.update(_get_tables(
+                            db_alias, expression.query, is_subquery=True))
                 elif isinstance(expression, RawSQL):
                     sql = expression.as_sql(None, None)[0].lower()
                     tables.update(_get_tables_from_sql(connections[db_alias], sql))
         # Gets tables in WHERE subqueries.
         for subquery in _find_subqueries_in_where(query.where.children):
-            tables.update(_get_tables(db_alias, subquery))
+            tables.update(_get_tables(db_alias, subquery, is_subquery=True))
         # Gets tables in HAVING subqueries.
         if isinstance(query, AggregateQuery):
             try:
                 tables.update(_get_tables_from_sql(connections[db_alias], query.subquery))
             except TypeError:  # For Django 3.2+
-                tables.update(_get_tables(db_alias, query.inner_query))
+                tables.update(_get_tables(db_alias, query.inner_query,
+                                          is_subquery=True))
         # Gets tables in combined queries
         # using `.union`, `.intersection`, or `difference`.
         if query.combined_queries:
             for combined_query in query.combined_queries:
-                tables.update(_get_tables(db_alias, combined_query))
+                tables.update(_get_tables(db_alias, combined_query,
+                                          is_subquery=True))
     except IsRawQuery:
-        sql = query.get_compiler(db_alias).as_sql()[0].lower()
+        sql = _get_lowercased_sql(db_alias, query, compiler)
         tables = _get_tables_from_sql(connections[db_alias], sql)
     else:
         # Additional check of the final SQL.
         # Potentially overlooked tables are added here. Tables may be overlooked by the regular checks
         # as not all expressions are handled yet. This final check acts as safety net.
-        if cachalot_settings.CACHALOT_FINAL_SQL_CHECK:
-            if compiler:
-                # Access generated SQL stored when caching the query!
-                sql = compiler.__cachalot_generated_sql
-            else:
-                sql = query.get_compiler(db_alias).as_sql()[0].lower()
+        # Subqueries are part of the final SQL of the outermost query,
+        # so they are already checked with it.
+        if cachalot_settings.CACHALOT_FINAL_SQL_CHECK and not is_subquery:
+            sql = _get_lowercased_sql(db_alias, query, compiler)
             final_check_tables = _get_tables_from_sql(connections[db_alias], sql, enable_quote=True)
             tables.update(final_check_tables)
 
@@ -292,20 +606,154 @@ def _get_tables(db_alias, query, compiler=False):
 
 def _get_table_cache_keys(compiler):
     db_alias = compiler.using
+    # Digest of the database alias and the SQL, set by
+    # `get_query_cache_key`, it is missing with some custom keygens.
+    memo_key = getattr(compiler, '__cachalot_sql_digest', None)
+    if memo_key is not None:
+        table_cache_keys = _tables_memo.get(memo_key)
+        if table_cache_keys is _UNCACHABLE:
+            raise UncachableQuery
+        if table_cache_keys is not None:
+            return list(table_cache_keys)
+
+    try:
+        tables = _get_tables(db_alias, compiler.query, compiler)
+    except UncachableQuery:
+        if memo_key is not None:
+            _tables_memo.set(memo_key, _UNCACHABLE)
+        raise
     get_table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN
-    return [get_table_cache_key(db_alias, t)
-            for t in _get_tables(db_alias, compiler.query, compiler)]
+    table_cache_keys = [get_table_cache_key(db_alias, t) for t in tables]
+    if memo_key is not None:
+        _tables_memo.set(memo_key, tuple(table_cache_keys))
+    return table_cache_keys
+
+
+def _get_table_cache_alias():
+    """
+    Returns the alias of the cache storing the table invalidations
+    of the results stored in ``CACHALOT_CACHE``.
+    """
+    if cachalot_settings.CACHALOT_TABLE_CACHE is None:
+        return cachalot_settings.CACHALOT_CACHE
+    # Without `CACHALOT_CACHE`, nothing is stored outside transactions.
+    if cachalot_settings.CACHALOT_CACHE is None:
+        return None
+    return cachalot_settings.CACHALOT_TABLE_CACHE
+
+
+def _uses_versions(cache_alias):
+    return cache_alias in cachalot_settings.CACHALOT_VERSIONED_CACHES
+
+
+def _new_version():
+    # Counters start from a random value, so that a counter that expired
+    # or was evicted never comes back to a value it had before.
+    return randrange(1 << 48)
+
+
+def _get_versions(table_values, table_cache_keys):
+    return tuple([table_values[k] for k in sorted(table_cache_keys)])
 
 
-def _invalidate_tables(cache, db_alias, tables):
-    tables = filter_cachable(set(tables))
-    if not tables:
+def _get_generational_cache_key(cache_key, table_values, table_cache_keys):
+    """
+    Returns the key of ``cache_key`` for the current invalidation timestamps
+    or versions of its tables, found in ``table_values``.
+    """
+    versions = repr(_get_versions(table_values, table_cache_keys))
+    return '%s:%s' % (cache_key, blake2b(versions.encode('utf-8'),
+                                         digest_size=8).hexdigest())
+
+
+def _is_fresh(stamp, table_values, table_cache_keys):
+    """
+    Tells whether a result cached with ``stamp`` is still valid, given the
+    current values ``table_values`` of its tables.
+
+    ``stamp`` is either the timestamp of the result, or the version counters
+    of its tables when it was computed, in versioned caches.
+    """
+    if stamp.__class__ is tuple:
+        return stamp == _get_versions(table_values, table_cache_keys)
+    return stamp >= max(table_values.values())
+
+
+def _add_table_versions(cache, table_cache_keys, timeout):
+    """
+    Creates the version counters of tables that were never invalidated.
+    Returns ``None`` if another process created one of them in the meantime.
+    """
+    versions = dict.fromkeys(table_cache_keys, _new_version())
+    if cache.__class__ is SplitCache:
+        cache = cache.table_cache
+    if isinstance(cache, AtomicCache):
+        cache.set_many(versions, timeout)
+        return versions
+    for table_cache_key, version in versions.items():
+        if not cache.add(table_cache_key, version, timeout):
+            return None
+    return versions
+
+
+def _incr_table_versions(cache, table_cache_keys, timeout):
+    if isinstance(cache, MemoCache):
+        # Increments are made on the real cache, then read again from it.
+        _incr_table_versions(cache.cache, table_cache_keys, timeout)
+        cache.forget(table_cache_keys)
         return
-    now = time()
+    if incr_versions(cache, table_cache_keys, timeout, _new_version):
+        return
+    for table_cache_key in table_cache_keys:
+        try:
+            cache.incr(table_cache_key)
+        except ValueError:
+            if not cache.add(table_cache_key, _new_version(), timeout):
+                cache.incr(table_cache_key)
+
+
+def _invalidate_tables(cache, db_alias, tables, versioned=False):
+    _invalidate_tables_per_db(cache, {db_alias: tables}, versioned)
+
+
+def _invalidate_tables_per_db(cache, tables_per_db, versioned=False):
+    """
+    Invalidates the tables of several databases stored in the same cache,
+    with a single write per timeout.
+    """
     get_table_cache_key = cachalot_settings.CACHALOT_TABLE_KEYGEN
-    cache.set_many(
-        {get_table_cache_key(db_alias, t): now for t in tables},
-        cachalot_settings.CACHALOT_TIMEOUT)
+    keys_per_timeout = defaultdict(list)
+    invalidated_tables = set()
+    for db_alias, tables in tables_per_db.items():
+        tables = filter_cachable(set(tables))
+        timeouts = _get_table_cache_key_setting('CACHALOT_TABLE_TIMEOUTS',
+                                                db_alias)
+        for table in tables:
+            table_cache_key = get_table_cache_key(db_alias, table)
+            keys_per_timeout[timeouts.get(
+                table_cache_key, cachalot_settings.CACHALOT_TIMEOUT)].append(
+                table_cache_key)
+        invalidated_tables.update(tables)
+    if not keys_per_timeout:
+        return
+
+    if versioned and not isinstance(cache, AtomicCache):
+        for timeout, keys in keys_per_timeout.items():
+            _incr_table_versions(cache, keys, timeout)
+    else:
+        # Inside a transaction, any new version makes previous results stale,
+        # counters are incremented when the transaction is committed.
+        value = _new_version() if versioned else time()
+        for timeout, keys in keys_per_timeout.items():
+            cache.set_many(dict.fromkeys(keys, value), timeout)
 
     if isinstance(cache, AtomicCache):
-        cache.to_be_invalidated.update(tables)
+        cache.to_be_invalidated.update(invalidated_tables)
+        return
+    table_cache_keys = [key for keys in keys_per_timeout.values()
+                        for key in keys]
+    if local_result_cache:
+        local_result_cache.invalidate(table_cache_keys)
+    if local_table_cache:
+        local_table_cache.invalidate(table_cache_keys)
+    invalidation_bus.publish(table_cache_keys)
@@ -83,6 +83,10 @@ else:
         # redis cache backend.
         'LOCATION': 'redis://127.0.0.1:6379/1',
     }
+    CACHES['cachalot_redis'] = {
+        'BACKEND': 'cachalot.backends.CachalotRedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/2',
+    }
 
 try:
     import pylibmc